@@ -0,0 +1,95 @@
+"""
+Micro-benchmark of the island aggregation of states_evaluation.
+
+Compares load_curtailment_expr (pandas lookups per cluster) with
+load_curtailment_labels (bincount over a label vector) on the label vectors
+of the example case and on a synthetic feeder. Run from the main folder:
+
+    python benchmarks/island_aggregation.py [--buses 2000] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from connectivity import StateConnectivity, full_combinations, split_clusters  # noqa: E402
+from data import (read_data_alternative, find_relevant_candidates, bus_arrays,  # noqa: E402
+                  load_curtailment_expr, load_curtailment_labels)
+
+
+def case_labels(data):
+    """Label vectors of every state and combination of a case."""
+    line_tb, bus_tb = data.lines, data.bus_tb
+    candidate_lines = line_tb.loc[line_tb.candidate == 1]
+    active = ((line_tb.base_topology == 1) & (line_tb.existing == 1)).to_numpy()
+    labels = []
+    for state in data.grid_states.keys():
+        state_active = active.copy()
+        state_active[data.grid_states.outage(state)] = False
+        state_lines = line_tb.loc[state_active]
+        net = StateConnectivity(bus_tb.index, state_lines['from'].values, state_lines['to'].values)
+        rel = candidate_lines.loc[find_relevant_candidates(
+            net, candidate_lines, bus_tb.g_tr_max_kw.to_numpy())]
+        fr, to = net.positions(rel['from'].values), net.positions(rel['to'].values)
+        labels += [net.combine(fr[on], to[on]) for _, on, _ in full_combinations(len(rel))]
+    return labels
+
+
+def synthetic(n_buses, n_vectors, rng):
+    """Bus table and label vectors of a synthetic feeder, with islands of 1 to 50 buses."""
+    bus_tb = pd.DataFrame({
+        'peakDemand_kw': rng.uniform(0, 300, n_buses).round(2),
+        'g_tr_max_kw': np.where(rng.random(n_buses) < 0.005, 10000.0, 0.0),
+        'candidate': (rng.random(n_buses) < 0.02).astype(int)},
+        index=pd.Index(np.arange(1, n_buses + 1), name='bus'))
+    labels = []
+    for _ in range(n_vectors):
+        cuts = np.sort(rng.choice(np.arange(1, n_buses), rng.integers(5, n_buses // 50), replace=False))
+        sizes = np.diff(np.concatenate([[0], cuts, [n_buses]]))
+        labels.append(np.repeat(np.arange(len(sizes)), sizes))
+    return bus_tb, labels
+
+
+def run(bus_tb, labels, repeat):
+    buses = bus_arrays(bus_tb)
+    clusters = [[buses['bus'][c] for c in split_clusters(lb)] for lb in labels]
+    times = {}
+    for name, func in [('pandas', lambda: [load_curtailment_expr(c, bus_tb) for c in clusters]),
+                       ('bincount', lambda: [load_curtailment_labels(lb, buses) for lb in labels])]:
+        best = np.inf
+        for _ in range(repeat):
+            t = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - t)
+        times[name] = best
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--case', default='example_case')
+    parser.add_argument('--buses', type=int, default=2000)
+    parser.add_argument('--vectors', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with redirect_stdout(io.StringIO()):
+        data = read_data_alternative(args.case, prune=True)
+    cases = {args.case: (data.bus_tb, case_labels(data)),
+             f'synthetic_{args.buses}': synthetic(args.buses, args.vectors, np.random.default_rng(0))}
+
+    print(f'{"case":<20}{"buses":>8}{"vectors":>9}{"pandas s":>11}{"bincount s":>12}{"speedup":>9}')
+    for name, (bus_tb, labels) in cases.items():
+        t = run(bus_tb, labels, args.repeat)
+        print(f'{name:<20}{len(bus_tb):>8}{len(labels):>9}{t["pandas"]:>11.4f}'
+              f'{t["bincount"]:>12.4f}{t["pandas"] / t["bincount"]:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
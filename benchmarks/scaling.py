@@ -0,0 +1,156 @@
+"""
+Scaling benchmark of the whole pipeline on synthetic feeders.
+
+For every point of a grid of case sizes, a synthetic case is written (see
+synthetic_case.py) and each phase is timed separately with a Profiler (see
+profiling.py): reading the CSV files, building the network and getting its
+data, states_evaluation, every step of the model build (create_inputs,
+create_sets, ...), the solve and get_solutions. The report (one record per case
+with its sizes, phase times and peak memory, and the log-log slope of every
+phase against the number of buses) is written as JSON, so growth beyond linear
+shows up as an exponent above 1. Run from the main folder:
+
+    python benchmarks/scaling.py --buses 100 200 400 800 --candidates 10 --time-limit 60
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+from itertools import product
+
+import numpy as np
+import pandas as pd
+from pyomo.environ import Var, Constraint
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data import (read_case, build_network, states_evaluation, Namespace,  # noqa: E402
+                  ROUTINE_FAILURES)
+from exp_planning import CapsuleModel  # noqa: E402
+from profiling import Profiler  # noqa: E402
+from synthetic_case import synthetic_case  # noqa: E402
+
+SIZES = ['buses', 'substations', 'candidates', 'storage', 'days', 'events']
+
+# phases of the report, as recorded by the profiler
+PHASES = ['read_case', 'build_network', 'get_data', 'states_evaluation', 'create_inputs',
+          'create_sets', 'create_params', 'create_vars', 'create_constraints',
+          'create_objective', 'solve', 'get_solutions']
+
+
+def run_case(folder, solve=True, matrix=False, solver=None, time_limit=None, **kwargs):
+    """Time every phase of the pipeline on a case folder.
+
+    Arguments:
+        folder (str): Case folder.
+        solve (bool): False for stopping after the model build.
+        matrix (bool): True for building the operational constraints in\
+        matrix form.
+        solver (str/list): Solver, see CapsuleModel.solve.
+        time_limit (float): Time limit of the solve in seconds.
+        kwargs: Passed to states_evaluation (prune, max_relevant, workers).
+    Returns:
+        times (dict): Seconds of every phase.
+        sizes (dict): Number of states, scenarios, variables, constraints,\
+        the solve status and the peak resident memory in MB.
+    """
+    with Profiler() as prof:
+        tables = read_case(folder)
+        parameters = pd.read_csv(folder + '/generalParameters.csv').T.to_dict()[0]
+        net = build_network(tables, ROUTINE_FAILURES, [])
+        data = Namespace(**net.get_data())
+        data.parameters = parameters
+        data.state_expr = states_evaluation(data, **kwargs)
+
+        opt = CapsuleModel(profiler=prof)
+        opt.build_model(data, matrix)
+        m = opt.model
+        sizes = {'states': len(data.grid_states), 'scenarios': len(data.scenarios),
+                 'combinations': sum(len(s) for s in data.state_expr.values()),
+                 'variables': sum(len(v) for v in m.component_objects(Var)),
+                 'constraints': sum(len(c) for c in m.component_objects(Constraint, active=True))}
+
+        if solve:
+            res = opt.solve(solver, tee=False, time_limit=time_limit)
+            sizes['status'] = res.status
+            if res.objective is not None:
+                opt.get_solutions(data)
+    sizes['peak_rss_mb'] = max(r['peak_rss_mb'] or 0 for r in prof.records) or None
+    return {r['phase']: r['wall'] for r in prof.records}, sizes
+
+
+def exponents(records, phases):
+    """Log-log slope of the time of every phase against the number of buses,
+    over the records that differ only in buses."""
+    table = pd.DataFrame(records)
+    others = [s for s in SIZES if s != 'buses']
+    slopes = []
+    for key, group in table.groupby(others):
+        group = group.dropna(subset=['buses'])
+        if group.buses.nunique() < 2:
+            continue
+        row = dict(zip(others, np.atleast_1d(key).tolist()))
+        for phase in phases:
+            t = group[phase].dropna()
+            t = t[t > 0]
+            if t.size >= 2 and group.buses[t.index].nunique() >= 2:
+                row[phase] = float(np.polyfit(np.log(group.buses[t.index]), np.log(t), 1)[0])
+        slopes.append(row)
+    return slopes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--buses', type=int, nargs='+', default=[100, 200, 400])
+    parser.add_argument('--substations', type=int, nargs='+', default=[1])
+    parser.add_argument('--candidates', type=int, nargs='+', default=[10])
+    parser.add_argument('--storage', type=int, nargs='+', default=[4])
+    parser.add_argument('--days', type=int, nargs='+', default=[4])
+    parser.add_argument('--events', type=int, nargs='+', default=[100])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-solve', dest='solve', action='store_false',
+                        help='stop after building the model')
+    parser.add_argument('--solver', nargs='+', default=None)
+    parser.add_argument('--time-limit', type=float, default=60)
+    parser.add_argument('--matrix', action='store_true',
+                        help='build the operational constraints in matrix form')
+    parser.add_argument('--max-relevant', type=int, default=None,
+                        help='relevant candidates evaluated per state, see evaluate_state')
+    parser.add_argument('--workers', type=int, default=1, help='workers of states_evaluation')
+    parser.add_argument('--output', default='scaling.json')
+    args = parser.parse_args()
+
+    phases = PHASES if args.solve else PHASES[:-2]
+    records = []
+    grid = list(product(*[getattr(args, s) for s in SIZES]))
+    with tempfile.TemporaryDirectory() as tmp:
+        for n, point in enumerate(grid):
+            case = dict(zip(SIZES, point))
+            folder = f'{tmp}/case_{n}'
+            synthetic_case(folder, seed=args.seed, **case)
+            times, sizes = run_case(folder, solve=args.solve, matrix=args.matrix,
+                                    solver=args.solver, time_limit=args.time_limit,
+                                    prune=True, max_relevant=args.max_relevant,
+                                    workers=args.workers)
+            times = {p: times.get(p) for p in phases}
+            records.append({**case, **sizes, **times,
+                            'total': sum(t for t in times.values() if t is not None)})
+            print(f'{n + 1}/{len(grid)} ' + ', '.join(f'{k} {v}' for k, v in case.items()) +
+                  f': {records[-1]["total"]:.1f} s', file=sys.stderr)
+
+    report = {'phases': phases, 'records': records, 'exponents': exponents(records, phases)}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1, default=str)
+
+    table = pd.DataFrame(records).set_index(SIZES)
+    pd.set_option('display.width', 200)
+    print(table.reindex(columns=phases + ['total', 'peak_rss_mb']).T.round(3).to_string())
+    if report['exponents']:
+        print('\nlog-log slope against buses')
+        print(pd.DataFrame(report['exponents']).set_index(
+            [s for s in SIZES if s != 'buses']).T.round(2).to_string())
+    print(f'\nReport written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
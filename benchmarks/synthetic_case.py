@@ -0,0 +1,172 @@
+"""
+Synthetic feeders for scaling studies.
+
+Writes a case folder in the format of read_data_alternative (the files of
+CASE_FILES, generalParameters.csv and coordinates.csv) for a radial feeder of
+any size: every substation feeds a random tree of overhead and underground
+lines, candidate tie lines connect nearby buses of different laterals and
+storage candidates are placed at random load buses. Run from the main folder:
+
+    python benchmarks/synthetic_case.py --folder synthetic_case --buses 1000 --candidates 50
+
+Extreme events are not part of the case files: read_data_alternative applies
+data.EXTREME_EVENTS by default, which take out branches of the example case up to
+branch 43. Cases with fewer branches (buses - substations < 43) fail with a
+KeyError there and are read with extreme_events=[] (as scaling.py does) or with
+events over their own branches.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+HOURS = [f't{t}' for t in range(24)]
+
+# general parameters of the example case
+GENERAL_PARAMETERS = {'lambda': 0.5, 'alpha_cvar': 0.95, 'pf': 0.9, 'c_imb_usd_kwh': 50,
+                      'bigM': 99999, 'sbase_mva': 10, 'vbase_kv': 13.5, 'discount_rate': 0.03}
+
+
+def synthetic_case(folder, buses=200, substations=1, candidates=20, storage=4, days=4,
+                   events=100, seed=0):
+    """Write the case files of a synthetic feeder.
+
+    The feeder has buses - substations branches, with fewer than 43 it is read
+    with extreme_events=[] (see the extreme events above).
+
+    Arguments:
+        folder (str): Case folder, created if needed.
+        buses (int): Number of buses, substation buses included.
+        substations (int): Number of substations, each one feeds a tree of\
+        about buses / substations buses.
+        candidates (int): Number of candidate tie lines.
+        storage (int): Number of storage candidates, at different load buses.
+        days (int): Number of representative days.
+        events (int): Number of events of list_of_events.csv, with 1 to 3\
+        neighbouring branches out and sometimes a substation.
+        seed (int): Seed of the random generator.
+    Returns:
+        counts (dict): Number of buses, branches, candidates, storage units,\
+        days and events written.
+    """
+    rng = np.random.default_rng(seed)
+    if not 1 <= substations < buses:
+        raise ValueError('A case needs at least one substation and one load bus')
+    os.makedirs(folder, exist_ok=True)
+
+    # radial trees, buses are numbered feeder by feeder from the substation bus
+    parent = np.zeros(buses + 1, dtype=np.int64)
+    xy = np.zeros((buses + 1, 2))
+    feeder = np.zeros(buses + 1, dtype=np.int64)
+    roots = []
+    bus = 1
+    for s, size in enumerate(np.diff(np.linspace(0, buses, substations + 1).round().astype(int))):
+        roots.append(bus)
+        xy[bus] = (s * 4 * np.sqrt(size), 0)
+        feeder[bus] = s
+        for k in range(1, size):
+            # new buses hang from one of the last ones, giving long laterals
+            parent[bus + k] = bus + rng.integers(max(0, k - 8), k)
+            xy[bus + k] = xy[parent[bus + k]] + rng.normal(0, 1, 2)
+            feeder[bus + k] = s
+        bus += size
+    child = np.setdiff1d(np.arange(1, buses + 1), roots)
+    length = np.maximum(np.hypot(*(xy[child] - xy[parent[child]]).T) * 0.5, 0.05).round(2)
+    overhead = (rng.random(len(child)) < 0.8).astype(int)
+    branches = pd.DataFrame({
+        'branch_index': np.arange(1, len(child) + 1), 'from_bus': parent[child], 'to_bus': child,
+        'max_ka': 3, 'Z_ohm_km': 0.557, 'r_len_km': length, 'switch': 1, 'switch_nc': 1,
+        'recloser': 0, 'sectionalizer': 0, 'alpha': 1, 'OH': overhead})
+
+    loads = pd.DataFrame({'index': np.arange(1, len(child) + 1), 'bus': child,
+                          'peakDemand_kw': rng.uniform(20, 300, len(child)).round(2)})
+    loads['nCustomers'] = np.maximum((loads.peakDemand_kw / 10).round().astype(int), 1)
+    peak = loads.groupby(feeder[child]).peakDemand_kw.sum()
+    subs = pd.DataFrame({'substation_index': np.arange(1, substations + 1), 'bus': roots,
+                         'g_tr_max_kw': (np.ceil(peak.to_numpy() * 1.25 / 1000) * 1000).astype(int)})
+
+    # tie lines between each bus and one of its nearest buses out of its lateral
+    neighbours = set(zip(parent[child], child)) | set(zip(child, parent[child]))
+    ties = set()
+    for a in rng.permutation(np.arange(1, buses + 1)):
+        if len(ties) == candidates:
+            break
+        dist = np.hypot(*(xy[1:] - xy[a]).T)
+        for b in (np.argsort(dist)[1:6] + 1)[rng.permutation(5)]:
+            pair = (min(a, b), max(a, b))
+            if (a, b) not in neighbours and pair not in ties:
+                ties.add(pair)
+                break
+    if len(ties) < candidates:
+        raise ValueError(f'Only {len(ties)} candidate tie lines fit in {buses} buses')
+    ties = np.array(sorted(ties), dtype=np.int64).reshape(-1, 2)
+    tie_len = np.maximum(np.hypot(*(xy[ties[:, 0]] - xy[ties[:, 1]]).T) * 0.5, 0.05).round(2)
+    branch_candidates = pd.DataFrame({
+        'branch_candidate_index': np.arange(1, len(ties) + 1), 'from_bus': ties[:, 0],
+        'to_bus': ties[:, 1], 'max_ka': 3, 'c_fix_usd': (tie_len * 984252.0).round(2),
+        'Z_ohm_km': 0.557, 'r_len_km': tie_len, 'OH': 1, 'lifetime': 25})
+
+    if storage > len(child):
+        raise ValueError(f'Only {len(child)} load buses for {storage} storage candidates')
+    storage_candidates = pd.DataFrame({
+        'H': np.arange(1, storage + 1), 'bus': np.sort(rng.choice(child, storage, replace=False)),
+        'p_in_max_kw': 3, 'p_out_max_kw': 3, 's_charge': 2, 'eff': 0.9, 'c_SD_fix_usd': 0.001,
+        'c_SD_var_usd_kwh': 660, 'sd_max': 6000, 'lifetime': 15})
+
+    # daily profiles around a morning and evening peak, weights add up to a year
+    weight = rng.uniform(0.5, 1.5, days)
+    weight = np.diff(np.round(np.cumsum(np.r_[0, weight]) * 365 / weight.sum())).astype(int)
+    day_tb = pd.DataFrame({'days': np.arange(days), 'weight': weight})
+    hour = np.arange(24)
+    shape = 0.45 + 0.25 * np.exp(-(hour - 8) ** 2 / 8) + 0.45 * np.exp(-(hour - 18) ** 2 / 10)
+    demand = shape * rng.uniform(0.7, 1.1, (days, 1)) + rng.normal(0, 0.03, (days, 24))
+    demand = np.clip(demand, 0.1, 1)
+    costs = 0.05 + 0.13 * shape / shape.max() * rng.uniform(0.9, 1.1, (days, 1))
+    profiles = pd.concat([
+        pd.DataFrame(values.round(3), columns=HOURS).assign(type=name, day=np.arange(days))
+        for name, values in [('demand_profile', demand), ('costs_dol_kWh', costs),
+                             ('battery_soc', demand)]])[['type', 'day'] + HOURS]
+
+    # outages of a branch and its neighbours, some with a substation out
+    out = rng.integers(1, len(child) + 1, events)
+    rows = []
+    for i, b in enumerate(out, 1):
+        near = branches.index[(branches.from_bus == branches.to_bus[b - 1]) |
+                              (branches.to_bus == branches.from_bus[b - 1])] + 1
+        extra = rng.choice(near, min(len(near), rng.integers(0, 3)), replace=False)
+        rows.append({'': i, 'branches': ','.join(str(x) for x in [b, *extra]),
+                     'substations': rng.integers(1, substations + 1) if rng.random() < 0.05 else '',
+                     'frequency': round(rng.uniform(0.005, 0.15), 4),
+                     'duration': rng.integers(1, 5)})
+    event_list = pd.DataFrame(rows, columns=['', 'branches', 'substations', 'frequency', 'duration'])
+
+    tables = {'branches': branches, 'substations': subs, 'loads': loads,
+              'branch_candidates': branch_candidates, 'storage_candidates': storage_candidates,
+              'hourly_profiles': profiles, 'days': day_tb, 'list_of_events': event_list,
+              'generalParameters': pd.DataFrame([GENERAL_PARAMETERS]),
+              'coordinates': pd.DataFrame({'bus': np.arange(1, buses + 1),
+                                           'x': xy[1:, 0].round(2), 'y': xy[1:, 1].round(2)})}
+    for name, table in tables.items():
+        table.to_csv(f'{folder}/{name}.csv', index=False)
+    return {'buses': buses, 'branches': len(branches), 'candidates': len(ties),
+            'storage': storage, 'days': days, 'events': events}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--folder', default='synthetic_case')
+    parser.add_argument('--buses', type=int, default=200)
+    parser.add_argument('--substations', type=int, default=1)
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--storage', type=int, default=4)
+    parser.add_argument('--days', type=int, default=4)
+    parser.add_argument('--events', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    counts = synthetic_case(**vars(args))
+    print(f'{args.folder}: ' + ', '.join(f'{v} {k}' for k, v in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
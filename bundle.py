@@ -0,0 +1,177 @@
+"""
+Single-file case bundles.
+
+A bundle holds all the tables of a case (those of read_case and the general
+parameters) in one zip file, each table as a numpy structured array with fixed
+column dtypes (int64, float64, bool or fixed width strings) next to a JSON
+manifest with the index of every table and the hash of the case files it was
+made from. The file is read with a single sequential read and its tables are
+decoded in parallel, without any CSV parsing or type inference, so loading
+takes milliseconds and opens one file instead of ten on shared storage.
+
+Tables read from a bundle are the same as those of read_case, so they plug
+into build_network and data_from_network, and read_data_alternative accepts a
+bundle in place of a case folder. Convert a case folder from the main folder:
+
+    python bundle.py example_case example_case.npz
+"""
+import argparse
+import ast
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from profiling import profiled
+
+# version of the bundle layout, bundles of other versions are not read
+BUNDLE_FORMAT = 1
+
+# field of the structured arrays that holds the index of the table
+INDEX_FIELD = '__index__'
+
+
+def is_bundle(path):
+    """True if path is a bundle file rather than a case folder."""
+    return os.path.isfile(path) and zipfile.is_zipfile(path)
+
+
+def write_bundle(path, tables, compress=False, **info):
+    """Write tables to a bundle file.
+
+    Arguments:
+        path (str): Bundle file, replaced if it exists.
+        tables (dict): DataFrames by name, their index is kept when it is\
+        not a default RangeIndex.
+        compress (bool): True for deflating every table, which makes the\
+        file several times smaller (for slow shared storage) but takes longer\
+        to read than the uncompressed arrays.
+        info: JSON serializable information added to the manifest (e.g.\
+        the hash of the case files).
+    """
+    manifest = {'format': BUNDLE_FORMAT, 'tables': {}, **info}
+    tmp = path + '.tmp'
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED) as z:
+        for name, frame in tables.items():
+            array, manifest['tables'][name] = to_structured(frame)
+            with z.open(name + '.npy', 'w', force_zip64=True) as f:
+                np.lib.format.write_array(f, array, allow_pickle=False)
+        z.writestr('manifest.json', json.dumps(manifest, indent=1, default=str))
+    os.replace(tmp, path)
+
+
+def bundle_info(path):
+    """Manifest of a bundle: format, tables (index of every table) and the\
+    information given to write_bundle."""
+    with zipfile.ZipFile(path) as z:
+        return read_manifest(z, path)
+
+
+def read_manifest(z, path):
+    manifest = json.loads(z.read('manifest.json'))
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f'{path} is a bundle of format {manifest.get("format")}, '
+                         f'this version reads format {BUNDLE_FORMAT}')
+    return manifest
+
+
+@profiled
+def read_bundle(path, tables=None, workers=None):
+    """Tables of a bundle.
+
+    Arguments:
+        path (str): Bundle file.
+        tables (list): Names of the tables to read, all by default.
+        workers (int): Threads decoding the tables, one per table by default.
+    Returns:
+        tables (dict): DataFrames by name, with the dtypes and index they\
+        were written with.
+    """
+    with open(path, 'rb') as f:
+        raw = f.read()
+    with zipfile.ZipFile(io.BytesIO(raw)) as z:
+        manifest = read_manifest(z, path)
+    names = list(manifest['tables']) if tables is None else list(tables)
+    missing = set(names) - set(manifest['tables'])
+    if missing:
+        raise KeyError(f'Tables {", ".join(sorted(missing))} are not in {path}')
+
+    def load(name):
+        # every thread reads its own view of the file, members are inflated in
+        # one call, which releases the GIL
+        with zipfile.ZipFile(io.BytesIO(raw)) as z:
+            array = npy_array(z.read(name + '.npy'))
+        return from_structured(array, manifest['tables'][name])
+
+    if len(names) <= 1 or workers == 1:
+        return {name: load(name) for name in names}
+    with ThreadPoolExecutor(workers or len(names)) as ex:
+        return dict(zip(names, ex.map(load, names)))
+
+
+def npy_array(buffer):
+    """Array of the bytes of an .npy file, without copying them."""
+    # the header is parsed directly, numpy.lib.format filters it through the
+    # tokenizer, which takes longer than reading the data
+    major = np.lib.format.read_magic(io.BytesIO(buffer[:8]))[0]
+    size = 4 if major >= 2 else 2
+    length = int.from_bytes(buffer[8:8 + size], 'little')
+    header = ast.literal_eval(buffer[8 + size:8 + size + length].decode('latin1'))
+    dtype = np.lib.format.descr_to_dtype(header['descr'])
+    if dtype.hasobject or header['fortran_order'] or len(header['shape']) != 1:
+        raise ValueError('Bundle tables are one dimensional arrays without objects')
+    return np.frombuffer(buffer, dtype, count=header['shape'][0], offset=8 + size + length)
+
+
+def to_structured(frame):
+    """Structured array of a DataFrame and the description of its index.
+    Numeric and boolean columns keep their dtype, any other column is written
+    as fixed width strings with missing values as empty strings."""
+    indexed = not (isinstance(frame.index, pd.RangeIndex) and frame.index.start == 0 and
+                   frame.index.step == 1)
+    columns = {INDEX_FIELD: frame.index.to_series()} if indexed else {}
+    columns.update((str(c), frame[c]) for c in frame.columns)
+    arrays = [column_array(s) for s in columns.values()]
+    array = np.empty(len(frame), dtype=[(c, a.dtype) for c, a in zip(columns, arrays)])
+    for c, a in zip(columns, arrays):
+        array[c] = a
+    return array, {'index': frame.index.name if indexed else None, 'indexed': indexed}
+
+
+def from_structured(array, info):
+    """DataFrame of a structured array written by to_structured."""
+    columns = {c: array[c] if array.dtype[c].kind != 'U' else array[c].astype(object)
+               for c in array.dtype.names}
+    index = columns.pop(INDEX_FIELD, None)
+    frame = pd.DataFrame(columns, copy=False)
+    if info['indexed']:
+        frame.index = pd.Index(index, name=info['index'])
+    return frame
+
+
+def column_array(s):
+    """Fixed dtype array of a column."""
+    if s.dtype.kind in 'iufb':
+        return s.to_numpy()
+    values = s.to_numpy(dtype=object)
+    return np.array(['' if pd.isna(v) else str(v) for v in values], dtype=str)
+
+
+def main():
+    from data import case_to_bundle
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('folder', help='case folder')
+    parser.add_argument('path', nargs='?', default=None, help='bundle file, folder.npz by default')
+    parser.add_argument('--compress', action='store_true',
+                        help='compress the tables, smaller files that take longer to read')
+    args = parser.parse_args()
+    path = case_to_bundle(args.folder, args.path, compress=args.compress)
+    print(f'{args.folder} written to {path} ({os.path.getsize(path) / 1E3:.1f} kB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Content-addressed on-disk cache for preprocessed data.
+
+Entries are pickled objects named after the hash of the inputs that produced
+them, so an unchanged case folder is reloaded instead of being preprocessed
+again. The cache folder is kept under a size limit by removing the least
+recently used entries.
+"""
+import hashlib
+import json
+import logging
+import os
+from utils import save_object, load_object
+
+logger = logging.getLogger("MAIN")
+
+
+class DataCache:
+    """Size-bounded cache of pickled objects.
+
+    Arguments:
+        folder (str): Folder where the cache entries are stored.
+        max_size_mb (float): Maximum size of the folder, the least recently\
+        used entries are removed above it.
+    """
+
+    def __init__(self, folder='.cache', max_size_mb=512):
+        self.folder = folder
+        self.max_size = max_size_mb * 1E6
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def key(files=(), **settings):
+        """Hash of the contents of files and of the settings.
+
+        Arguments:
+            files (list): Paths of the files to hash, their order is irrelevant.
+            settings: Any JSON serializable settings that change the result.
+        """
+        h = hashlib.sha256()
+        for f in sorted(files):
+            h.update(os.path.basename(f).encode())
+            with open(f, 'rb') as stream:
+                for block in iter(lambda: stream.read(1 << 20), b''):
+                    h.update(block)
+        h.update(json.dumps(settings, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.pkl')
+
+    def load(self, key):
+        """Return the object stored under key, or None if it is not cached."""
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            obj = load_object(path)
+        except Exception:
+            logger.warning(f'Cache entry {key} could not be read, removing it')
+            os.remove(path)
+            return None
+        os.utime(path)  # mark as recently used
+        logger.debug(f'Cache hit {key}')
+        return obj
+
+    def save(self, key, obj):
+        """Store obj under key and evict old entries if the cache is too big."""
+        tmp = self.path(key) + '.tmp'
+        save_object(obj, tmp)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits its size."""
+        entries = [os.path.join(self.folder, f) for f in os.listdir(self.folder)
+                   if f.endswith('.pkl')]
+        entries = sorted(entries, key=os.path.getmtime, reverse=True)
+        total = 0
+        for n, path in enumerate(entries):
+            total += os.path.getsize(path)
+            # the most recent entry is always kept
+            if total > self.max_size and n > 0:
+                logger.debug(f'Evicting cache entry {os.path.basename(path)}')
+                os.remove(path)
@@ -0,0 +1,141 @@
+"""
+Integer-indexed connectivity used by the grid state evaluation.
+
+Buses are referred to by their position in the bus table, so every grid state
+is solved with plain arrays instead of copying a networkx graph for each
+combination of candidate lines.
+"""
+from itertools import product
+import numpy as np
+
+
+class UnionFind:
+    """Disjoint-set forest over the integer nodes 0..n-1."""
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+
+    def find(self, a):
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            # keep the smallest node as root, so roots are stable between calls
+            if ra < rb:
+                self.parent[rb] = ra
+            else:
+                self.parent[ra] = rb
+
+    def copy(self):
+        uf = UnionFind(0)
+        uf.parent = self.parent.copy()
+        return uf
+
+    def roots(self):
+        """Root of every node as a numpy array."""
+        return np.array([self.find(a) for a in range(len(self.parent))], dtype=np.int64)
+
+
+def relabel(roots):
+    """Number components in order of their first bus, as nx.connected_components does
+    for a graph whose nodes were added in bus order."""
+    _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first))
+    return rank[inverse]
+
+
+def split_clusters(labels):
+    """Bus positions of every cluster, given a label vector numbered from 0."""
+    order = np.argsort(labels, kind='stable')
+    counts = np.bincount(labels)
+    return np.split(order, np.cumsum(counts)[:-1])
+
+
+class StateConnectivity:
+    """Connectivity of one grid state.
+
+    The components of the active (non-candidate) branches are computed once.
+    Candidate branches are then added on top of the component graph, which is
+    usually a few nodes, so every combination of investments costs O(k) unions.
+
+    Arguments:
+        bus_index (pd.Index): Index of the bus table, defines the bus positions.
+        fr (array): From bus of every active branch.
+        to (array): To bus of every active branch.
+    """
+
+    def __init__(self, bus_index, fr, to):
+        self.bus_index = bus_index
+        uf = UnionFind(len(bus_index))
+        for a, b in zip(self.positions(fr), self.positions(to)):
+            uf.union(a, b)
+        self.component = relabel(uf.roots())
+        self.n_components = int(self.component.max()) + 1 if len(self.component) else 0
+
+    def positions(self, buses):
+        """Positions of bus labels in the bus table."""
+        return self.bus_index.get_indexer(np.asarray(buses))
+
+    def clusters(self, labels=None):
+        """Clusters as arrays of bus positions, in nx.connected_components order."""
+        return split_clusters(self.component if labels is None else labels)
+
+    def combine(self, fr, to):
+        """Component label of every bus after adding the candidate branches fr -> to,
+        given as bus positions."""
+        cf, ct = self.component[fr], self.component[to]
+        if len(cf) == 0:
+            return self.component
+        uf = UnionFind(self.n_components)
+        for a, b in zip(cf, ct):
+            uf.union(a, b)
+        return relabel(uf.roots()[self.component])
+
+
+def full_combinations(k):
+    """Every combination of k candidates, as (row of product([0, 1], repeat=k), on, off)."""
+    for j, row in enumerate(product([0, 1], repeat=k)):
+        on = np.array(row, dtype=bool)
+        yield j, on, ~on
+
+
+def forest_combinations(n_components, cf, ct):
+    """Combinations in which every selected candidate joins two different islands.
+
+    Candidates are taken in order; one whose components are already joined by the
+    base state plus the candidates selected before it only closes a loop, so it is
+    left free (neither on nor off) instead of doubling the combinations. Every
+    investment decision still matches exactly one of the combinations.
+
+    Arguments:
+        n_components (int): Number of components of the grid state.
+        cf (array): Component of the from bus of every candidate.
+        ct (array): Component of the to bus of every candidate.
+    Returns:
+        generator of (row of product([0, 1], repeat=k), on, off), in row order.
+    """
+    k = len(cf)
+
+    def visit(i, uf, j, on, off):
+        if i == k:
+            yield j, on, off
+            return
+        a, b = uf.find(cf[i]), uf.find(ct[i])
+        if a == b:
+            yield from visit(i + 1, uf, j << 1, on, off)
+        else:
+            yield from visit(i + 1, uf, j << 1, on, off + [i])
+            joined = uf.copy()
+            joined.union(a, b)
+            yield from visit(i + 1, joined, (j << 1) | 1, on + [i], off)
+
+    for j, on, off in visit(0, UnionFind(n_components), 0, [], []):
+        on_mask, off_mask = np.zeros(k, dtype=bool), np.zeros(k, dtype=bool)
+        on_mask[on], off_mask[off] = True, True
+        yield j, on_mask, off_mask
@@ -1,10 +1,16 @@
 from types import SimpleNamespace
+from copy import deepcopy
 import logging
 import pandas as pd
 import networkx as nx
 from itertools import product
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from network import Network
+from connectivity import StateConnectivity, full_combinations, forest_combinations
+from profiling import profiled
+from cache import DataCache
+from bundle import is_bundle, bundle_info, read_bundle, write_bundle
 
 logger = logging.getLogger("MAIN")
 
@@ -12,57 +18,163 @@ logger = logging.getLogger("MAIN")
 class Namespace(SimpleNamespace):
     def __repr__(self):
         return "Namespace consisting of attributes lines, bus_tb, storage, substations, " \
-               "grid_states, scenarios, bat_prof, scenarios_time, line_loss, substation_loss, " \
+               "grid_states, scenarios, bat_prof, f_load, line_loss, substation_loss, " \
                "days, demand_prof, substations_cost and state_expr"
 
 
-def read_data_alternative(folder):
+ROUTINE_FAILURES = {
+    'overhead_lines': (0.2, 2),
+    'underground_lines': (0.1, 1),
+    'substations': (0.05, 1)
+}
+
+EXTREME_EVENTS = [
+    {'branches': [1, 2, 3], 'substations': [1], 'frequency': 0.02, 'duration': 50},
+    {'branches': [43, 26, 37], 'substations': [], 'frequency': 0.01, 'duration': 60}
+]
+
+# case files read by read_data_alternative, generalParameters.csv is not part of
+# the preprocessing and is read again on every call
+CASE_FILES = ['branches.csv', 'substations.csv', 'loads.csv', 'branch_candidates.csv',
+              'storage_candidates.csv', 'hourly_profiles.csv', 'days.csv', 'list_of_events.csv']
+
+# version of the preprocessed data layout, part of the cache key so entries written
+# before a change of layout are not reloaded
+DATA_FORMAT = 4
+
+
+@profiled
+def read_data_alternative(folder, routine_failures=None, extreme_events=None, cache=None, **kwargs):
+    """Read a case folder or bundle, kwargs are passed to states_evaluation.
+
+    Arguments:
+        folder (str): Case folder, or bundle file written by case_to_bundle.
+        routine_failures (dict): Frequency and duration of routine failures,\
+        ROUTINE_FAILURES by default.
+        extreme_events (list): Extreme events, EXTREME_EVENTS by default.
+        cache (DataCache): Optional cache, the preprocessed data is reloaded\
+        from it when the case files and settings did not change.
+    Returns:
+        data (Namespace): Preprocessed case, with the hash of its files and\
+        settings as input_hash.
+    """
+    if routine_failures is None:
+        routine_failures = ROUTINE_FAILURES
+    if extreme_events is None:
+        extreme_events = EXTREME_EVENTS
+
+    parameters = read_parameters(folder)
+    key = case_key(folder, routine_failures, extreme_events, **kwargs)
+    if cache is not None:
+        data = cache.load(key)
+        if data is not None:
+            logger.info(f'Preprocessed data of {folder} loaded from cache')
+            data.parameters = parameters
+            data.input_hash = key
+            return data
+
+    tables = read_bundle(folder) if is_bundle(folder) else read_case(folder)
+    mv_network = build_network(tables, routine_failures, extreme_events)
 
-    parameters = pd.read_csv(folder + '/generalParameters.csv')
-    parameters = parameters.T.to_dict()[0]
+    net_data = mv_network.get_data()
+    data = Namespace()
+    for d in net_data.keys():
+        setattr(data, d, net_data[d])
+
+    data.parameters = parameters
+    data.state_expr = states_evaluation(data, **kwargs)
+    data.input_hash = key
+    if cache is not None:
+        cache.save(key, data)
+    return data
 
-    net_inputs = {
+
+def case_key(folder, routine_failures=None, extreme_events=None, **kwargs):
+    """Hash of the case files of a folder or bundle and of the preprocessing
+    settings (kwargs of states_evaluation), the key of the preprocessed data
+    in a DataCache. The general parameters are not part of it."""
+    if routine_failures is None:
+        routine_failures = ROUTINE_FAILURES
+    if extreme_events is None:
+        extreme_events = EXTREME_EVENTS
+    # the number of workers and the equation files do not change the result
+    settings = {k: v for k, v in kwargs.items() if k not in ('workers', 'write_eq')}
+    if is_bundle(folder):
+        return DataCache.key(case_hash=bundle_info(folder)['case_hash'],
+                             routine_failures=routine_failures, extreme_events=extreme_events,
+                             data_format=DATA_FORMAT, **settings)
+    return DataCache.key([folder + '/' + f for f in CASE_FILES],
+                         routine_failures=routine_failures, extreme_events=extreme_events,
+                         data_format=DATA_FORMAT, **settings)
+
+
+def read_parameters(folder):
+    """General parameters of a case folder or bundle, as a dictionary."""
+    if is_bundle(folder):
+        parameters = read_bundle(folder, ['parameters'])['parameters']
+    else:
+        parameters = pd.read_csv(folder + '/generalParameters.csv')
+    return parameters.T.to_dict()[0]
+
+
+@profiled
+def read_case(folder):
+    """Tables of the case files of a folder (see CASE_FILES)."""
+    return {
         'branches': pd.read_csv(folder + '/branches.csv', index_col=0),
         'substations': pd.read_csv(folder + '/substations.csv', index_col=0),
         'loads': pd.read_csv(folder + '/loads.csv', index_col=0),
         'branch_candidates': pd.read_csv(folder + '/branch_candidates.csv', index_col=0),
-        'storage_candidates': pd.read_csv(folder + '/storage_candidates.csv')
+        'storage_candidates': pd.read_csv(folder + '/storage_candidates.csv'),
+        'profiles': pd.read_csv(folder + '/hourly_profiles.csv'),
+        'day_weights': pd.read_csv(folder + '/days.csv', index_col=0),
+        'event_list': pd.read_csv(folder + '/list_of_events.csv', index_col=0)
     }
+
+
+def case_to_bundle(folder, path=None, compress=False):
+    """Write the tables of a case folder (see read_case) and its general
+    parameters to a single bundle file, see bundle.py.
+
+    Arguments:
+        folder (str): Case folder.
+        path (str): Bundle file, the folder name with .npz by default.
+        compress (bool): True for compressing the tables.
+    Returns:
+        path (str): Bundle file.
+    """
+    if path is None:
+        path = folder.rstrip('/\\') + '.npz'
+    tables = read_case(folder)
+    tables['parameters'] = pd.read_csv(folder + '/generalParameters.csv')
+    write_bundle(path, tables, compress,
+                 case_hash=DataCache.key([folder + '/' + f for f in CASE_FILES]))
+    return path
+
+
+@profiled
+def build_network(tables, routine_failures, extreme_events):
+    """Network of the tables of a case (see read_case), with its profiles and
+    failure events."""
+    net_inputs = {k: tables[k] for k in ['branches', 'substations', 'loads',
+                                         'branch_candidates', 'storage_candidates']}
     mv_network = Network(**net_inputs)
 
     hourly_profiles = {
-        'profiles': pd.read_csv(folder + '/hourly_profiles.csv'),
-        'day_weights': pd.read_csv(folder + '/days.csv', index_col=0)
+        'profiles': tables['profiles'],
+        'day_weights': tables['day_weights']
     }
 
     mv_network.add_hourly_profiles(hourly_profiles)
-
-    routine_failures = {
-        'overhead_lines': (0.2, 2),
-        'underground_lines': (0.1, 1),
-        'substations': (0.05, 1)
-    }
     mv_network.add_routine_failures(routine_failures)
+    mv_network.add_extreme_events(deepcopy(extreme_events))
 
-    extreme_events = [
-        {'branches': [1, 2, 3], 'substations': [1], 'frequency': 0.02, 'duration': 50},
-        {'branches': [43, 26, 37], 'substations': [], 'frequency': 0.01, 'duration': 60}
-    ]
-    mv_network.add_extreme_events(extreme_events)
+    mv_network.add_event_list(tables['event_list'])
+    return mv_network
 
-    mv_network.add_event_list(pd.read_csv(folder + '/list_of_events.csv', index_col=0))
 
-    net_data = mv_network.get_data()
-    data = Namespace()
-    for d in net_data.keys():
-        setattr(data, d, net_data[d])
-
-    data.parameters = parameters
-    data.state_expr = states_evaluation(data)
-    return data
-
-
-def data_from_network(net, parameters):
+def data_from_network(net, parameters, **kwargs):
+    """Get data from a Network, kwargs are passed to states_evaluation."""
     net_data = net.get_data()
     data = Namespace()
     for d in net_data.keys():
@@ -70,11 +182,107 @@ def data_from_network(net, parameters):
 
     parameters = parameters.T.to_dict()[0]
     data.parameters = parameters
-    data.state_expr = states_evaluation(data)
+    data.state_expr = states_evaluation(data, **kwargs)
 
     return data
 
 
+class IncrementalData:
+    """Data of a Network that keeps the evaluated grid states between calls.
+
+    Grid states are stored by their set of outaged lines, so after adding
+    events only the new outage sets are evaluated. When the branch candidates
+    change, only the states whose relevant candidates changed are evaluated
+    again; the others are renumbered to the new line indexes. Any change of
+    the existing branches or buses evaluates everything again.
+
+    Arguments:
+        net (Network): Network, can be modified between calls to get_data.
+        parameters (pd.DataFrame): General parameters.
+        kwargs: Passed to states_evaluation.
+    """
+
+    def __init__(self, net, parameters, **kwargs):
+        self.net = net
+        self.parameters = parameters
+        self.kwargs = kwargs
+        self.evaluated = {}
+        self.signature = None
+        self.candidates, self.candidate_idx = [], []
+
+    def get_data(self):
+        """Same as data_from_network, evaluating only the new grid states."""
+        net_data = self.net.get_data()
+        data = Namespace()
+        for d in net_data.keys():
+            setattr(data, d, net_data[d])
+        data.parameters = self.parameters.T.to_dict()[0]
+
+        line_tb, bus_tb = data.lines, data.bus_tb
+        active = ((line_tb.existing == 1) & (line_tb.base_topology == 1)).to_numpy()
+        signature = (pd.util.hash_pandas_object(line_tb.loc[active, ['from', 'to']]).sum(),
+                     pd.util.hash_pandas_object(bus_tb[['peakDemand_kw', 'g_tr_max_kw',
+                                                        'candidate']]).sum())
+        if signature != self.signature:
+            self.evaluated = {}
+            self.signature = signature
+
+        # candidates are identified by their label and buses, positions change
+        cand = self.net.candidate_branches
+        candidates = list(zip(cand.index, cand.from_bus, cand.to_bus)) if len(cand) else []
+        if candidates != self.candidates and self.evaluated:
+            self._update_candidates(line_tb, bus_tb, active, candidates)
+        self.candidates = candidates
+        self.candidate_idx = list(line_tb.index[line_tb.candidate == 1])
+
+        grid_states = data.grid_states
+        outages = {c: tuple(int(o) for o in out if active[o])
+                   for c, out in grid_states.outages.items()}
+        new_states = [c for c, out in outages.items() if out not in self.evaluated]
+        logger.info(f'Evaluating {len(new_states)} of {len(outages)} grid states')
+        if new_states:
+            pending = Namespace(grid_states=grid_states[new_states], lines=line_tb, bus_tb=bus_tb)
+            for c, expr in states_evaluation(pending, **self.kwargs).items():
+                self.evaluated[outages[c]] = expr
+
+        data.state_expr = {c: self.evaluated[out] for c, out in outages.items()}
+        return data
+
+    def _update_candidates(self, line_tb, bus_tb, active, candidates):
+        """Keep the evaluated states whose relevant candidates did not change."""
+        candidate_lines = line_tb.loc[line_tb.candidate == 1]
+        old_idx = dict(zip(self.candidates, self.candidate_idx))
+        new_idx = dict(zip(candidates, candidate_lines.index))
+        renumber = {float(old_idx[c]): float(new_idx[c]) for c in old_idx if c in new_idx}
+
+        max_relevant = self.kwargs.get('max_relevant')
+        g_tr_max = bus_tb.g_tr_max_kw.to_numpy()
+        fr, to = line_tb['from'].to_numpy(), line_tb['to'].to_numpy()
+        updated = 0
+        for outage, expr in list(self.evaluated.items()):
+            state_active = active.copy()
+            state_active[list(outage)] = False
+            state_net = StateConnectivity(bus_tb.index, fr[state_active], to[state_active])
+            relevant = list(find_relevant_candidates(state_net, candidate_lines, g_tr_max))[:max_relevant]
+            old_relevant = [renumber.get(c) for c in expr[0]['rel_off']]
+            if relevant != old_relevant:
+                del self.evaluated[outage]
+                updated += 1
+            elif renumber and any(k != v for k, v in renumber.items()):
+                self.evaluated[outage] = renumber_state(expr, renumber)
+        logger.info(f'Candidates changed, {updated} evaluated grid states affected')
+
+
+def renumber_state(state_expr, renumber):
+    """State expressions with the candidate lines renumbered."""
+    def rn(lines):
+        return np.array([renumber[c] for c in lines]) if len(lines) else lines
+    return {j: {'rel_on': rn(comb['rel_on']) if j else comb['rel_on'],
+                'rel_off': rn(comb['rel_off']) if j == 0 else np.unique(rn(comb['rel_off'])),
+                'islands': comb['islands']}
+            for j, comb in state_expr.items()}
+
+
 def create_graph(active_lines, nodes_tb):
     """Create graph and obtain isolated nodes."""
     network = nx.Graph()
@@ -84,9 +292,12 @@ def create_graph(active_lines, nodes_tb):
     return network, islands
 
 
-def states_evaluation(data, write_eq=False):
+@profiled
+def states_evaluation(data, write_eq=False, workers=1, **kwargs):
     """Heuristic to obtain states in terms of load. Use write_eq to True
-    to write equations to a file."""
+    to write equations to a file. Use workers > 1 to evaluate the grid
+    states on a process pool; results are merged in the grid_states order.
+    Other kwargs (prune, max_relevant) are passed to evaluate_state."""
     grid_states = data.grid_states
     line_tb = data.lines
     bus_tb = data.bus_tb
@@ -95,72 +306,130 @@ def states_evaluation(data, write_eq=False):
         equation_file = open("equations_model.txt", "w")
 
     state_expr = {}
+    tasks = ((state, grid_states.outage(state)) for state in grid_states.keys())
+
+    if workers > 1:
+        chunksize = max(1, len(grid_states) // (4 * workers))
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(line_tb, bus_tb, kwargs)) as pool:
+            results = list(pool.map(_evaluate_worker, tasks, chunksize=chunksize))
+    else:
+        results = ((state, evaluate_state(state, outage, line_tb, bus_tb, **kwargs))
+                   for state, outage in tasks)
+
+    for state, expr in results:
+        state_expr[state] = expr
+        if write_eq:
+            write_state(state, expr, text_file, equation_file)
+    intern_islands(state_expr)
 
-    candidate_lines = line_tb.loc[line_tb.candidate == 1].copy()
-    states = grid_states.keys()
+    if write_eq:
+        text_file.close()
+        equation_file.close()
+    return state_expr
 
-    for state in states:
-        print('Evaluating state: ', state)
-        state_lines = line_tb.loc[grid_states[state] * line_tb.existing == 1].copy()
-        state_network, state_clusters = create_graph(state_lines, bus_tb)
 
-        primary_connection = np.array([bus_tb.loc[list(cluster)].g_tr_max_kw.sum() for cluster in state_clusters])
-        isolated_clusters = np.where(primary_connection == 0)[0]
-        connected_buses = set().union(*np.delete(state_clusters, isolated_clusters))
+def intern_islands(state_expr, registry=None):
+    """Make identical islands of all states and combinations the same object.
+
+    Arguments:
+        state_expr (dict): Evaluated states, modified in place.
+        registry (dict): Optional islands already interned, by buses.
+    Returns:
+        registry (dict): Unique islands by tuple of buses.
+    """
+    registry = {} if registry is None else registry
+    for combinations in state_expr.values():
+        for comb in combinations.values():
+            islands = comb['islands']
+            for e, isl in islands.items():
+                islands[e] = registry.setdefault(tuple(isl['buses_load']), isl)
+    return registry
+
+
+def evaluate_state(state, outage, line_tb, bus_tb, prune=False, max_relevant=None):
+    """Evaluate a single grid state given the positions of its lines out of service, returns
+    the dictionary of relevant investments and islands indexed by combination.
+    Use prune to skip the combinations in which a candidate only closes a loop
+    inside an island, and max_relevant to cap the relevant candidates of a state."""
+    logger.debug(f'Evaluating state: {state}')
+    candidate_lines = line_tb.loc[line_tb.candidate == 1]
+    buses = bus_arrays(bus_tb)
+
+    active = ((line_tb.base_topology == 1) & (line_tb.existing == 1)).to_numpy()
+    active[outage] = False
+    state_lines = line_tb.loc[active]
+    state_net = StateConnectivity(bus_tb.index, state_lines['from'].values, state_lines['to'].values)
+
+    relevant_candidates_idx = find_relevant_candidates(state_net, candidate_lines, buses['g_tr'])
+
+    if max_relevant is not None and len(relevant_candidates_idx) > max_relevant:
+        logger.warning(f'{state} has {len(relevant_candidates_idx)} relevant candidates, '
+                       f'only the first {max_relevant} are evaluated')
+        relevant_candidates_idx = relevant_candidates_idx[:max_relevant]
+
+    relevant_candidates = candidate_lines.loc[relevant_candidates_idx]
+    rel_fr = state_net.positions(relevant_candidates['from'].values)
+    rel_to = state_net.positions(relevant_candidates['to'].values)
+
+    if prune:
+        combinations = forest_combinations(state_net.n_components, state_net.component[rel_fr],
+                                           state_net.component[rel_to])
+    else:
+        combinations = full_combinations(len(relevant_candidates))
+
+    # expression for no-investments
+    next(combinations)
+    expr = load_curtailment_labels(state_net.component, buses)
+    state_expr = {0: {'rel_on': [], 'rel_off': relevant_candidates_idx, 'islands': expr}}
+
+    # expression for investment cases
+    for j, on, off in combinations:
+        labels = state_net.combine(rel_fr[on], rel_to[on])
+        expr = load_curtailment_labels(labels, buses)
+
+        if expr:
+            state_expr.update({j: {'rel_on': relevant_candidates_idx[on],
+                                   'rel_off': np.unique(relevant_candidates_idx[off]),
+                                   'islands': expr}})
+    return state_expr
 
-        # getting the relevant line candidates
-        # that connect isolated clusters to connected nodes
 
-        relevant_candidates_idx = []
-        for ic_idx in isolated_clusters:
-            connecting_lines_fr = candidate_lines.loc[
-                candidate_lines['from'].isin(state_clusters[ic_idx]) &
-                candidate_lines['to'].isin(connected_buses)]
+def find_relevant_candidates(state_net, candidate_lines, g_tr_max):
+    """Candidate lines that connect isolated clusters (without substation)
+    to connected ones, ordered by isolated cluster."""
+    primary_connection = np.bincount(state_net.component, weights=g_tr_max,
+                                     minlength=state_net.n_components)
+    isolated = primary_connection == 0
+    isolated_clusters = np.where(isolated)[0]
 
-            connecting_lines_to = candidate_lines.loc[
-                candidate_lines['from'].isin(connected_buses) &
-                candidate_lines['to'].isin(state_clusters[ic_idx])]
+    cand_fr = state_net.component[state_net.positions(candidate_lines['from'].values)]
+    cand_to = state_net.component[state_net.positions(candidate_lines['to'].values)]
 
-            relevant_candidates_idx = np.concatenate([relevant_candidates_idx,
-                                                      connecting_lines_fr.index,
-                                                      connecting_lines_to.index])
+    relevant_candidates_idx = []
+    for ic_idx in isolated_clusters:
+        connecting_lines_fr = candidate_lines.index[(cand_fr == ic_idx) & ~isolated[cand_to]]
+        connecting_lines_to = candidate_lines.index[~isolated[cand_fr] & (cand_to == ic_idx)]
 
-        relevant_candidates = candidate_lines.loc[relevant_candidates_idx]
+        relevant_candidates_idx = np.concatenate([relevant_candidates_idx,
+                                                  connecting_lines_fr,
+                                                  connecting_lines_to])
+    return relevant_candidates_idx
 
-        combination_matrix = list(product([0, 1], repeat=len(relevant_candidates)))
 
-        # writing expression for no-investments
-        if write_eq:
-            text_file.write("\n grid state: %s\n" % state)
-            text_file.write("info: relevant line investments %s\n" % relevant_candidates_idx)
-        expr = load_curtailment_expr(state_clusters, bus_tb)
-        if expr and write_eq:
-            text_file.write("---> no_investment\n")
-            write_expr(expr, text_file)
-            write_equations (expr, equation_file, relevant_candidates_idx, combination_matrix[0], state)
-        state_expr.update({state: {0: {'rel_on': [], 'rel_off': relevant_candidates_idx, 'islands': expr}}})
-
-        # writing expression for investment cases
-        for idx_row, row in enumerate(combination_matrix[1:]):
-            inv = row*relevant_candidates_idx
-            inv = inv[inv != 0]
-            cnd = relevant_candidates.loc[inv]
-            state_inv_net = state_network.copy()
-            state_inv_net.add_edges_from(list(cnd[['from', 'to']].itertuples(index=False, name=None)))
-            expr = load_curtailment_expr(sorted(nx.connected_components(state_inv_net)), bus_tb)
-
-            if expr:
-                if write_eq:
-                    text_file.write(f'---> investment in lines {str(inv)} \n')
-                    write_expr(expr, text_file)
-                    write_equations(expr, equation_file, relevant_candidates_idx, row, state)
-                state_expr[state].update({idx_row+1: {'rel_on': inv, 'rel_off': np.setxor1d(
-                    relevant_candidates_idx, inv), 'islands': expr}})
+# Process pool workers keep the line and bus tables, so only the
+# lines out of service of the grid states are sent with every task.
+_worker_tables = {}
 
-    if write_eq:
-        text_file.close()
-        equation_file.close()
-    return state_expr
+
+def _init_worker(line_tb, bus_tb, kwargs):
+    _worker_tables.update({'line_tb': line_tb, 'bus_tb': bus_tb, 'kwargs': kwargs})
+
+
+def _evaluate_worker(task):
+    state, outage = task
+    return state, evaluate_state(state, outage, _worker_tables['line_tb'],
+                                 _worker_tables['bus_tb'], **_worker_tables['kwargs'])
 
 
 def load_curtailment_expr(clusters, buses_tb, reduced=True):
@@ -190,6 +459,64 @@ def load_curtailment_expr(clusters, buses_tb, reduced=True):
     return curt_expr
 
 
+def bus_arrays(bus_tb):
+    """Bus table columns used by load_curtailment_labels, as numpy arrays."""
+    return {'bus': bus_tb.index.values,
+            'peak': bus_tb.peakDemand_kw.to_numpy(dtype=float),
+            'g_tr': bus_tb.g_tr_max_kw.to_numpy(dtype=float),
+            'storage': (bus_tb.candidate == 1).to_numpy()}
+
+
+def load_curtailment_labels(labels, buses, reduced=True):
+    """Same as load_curtailment_expr with the clusters given as a label vector
+    over the bus table (numbered from 0 in cluster order) and the bus table
+    as the arrays of bus_arrays. Totals of every cluster are obtained at once."""
+    n_clusters = int(labels.max()) + 1 if len(labels) else 0
+    peak = np.bincount(labels, weights=buses['peak'], minlength=n_clusters)
+    substation = np.bincount(labels, weights=buses['g_tr'], minlength=n_clusters)
+    islands = np.flatnonzero(peak > substation) if reduced else np.arange(n_clusters)
+
+    curt_expr = {}
+    if len(islands):
+        island_no = np.full(n_clusters, -1)
+        island_no[islands] = np.arange(len(islands))
+        pos = np.flatnonzero(island_no[labels] >= 0)
+        pos = pos[np.argsort(island_no[labels[pos]], kind='stable')]
+        counts = np.bincount(island_no[labels[pos]], minlength=len(islands))
+        for e, cluster in enumerate(np.split(pos, np.cumsum(counts)[:-1])):
+            curt_expr.update({e:
+                {'storage': buses['bus'][cluster[buses['storage'][cluster]]],
+                 'substation': substation[islands[e]],
+                 'buses_load': buses['bus'][cluster]}}
+            )
+    # If there is no island and everything is connected
+    if curt_expr == {}:
+        curt_expr.update({0:
+            {'storage': [],
+             'substation': 0,
+             'buses_load': []}}
+        )
+    return curt_expr
+
+
+def write_state(state, state_expr, text_file, equation_file):
+    """Write the expressions of a grid state, combinations are written with
+    their relevant investments."""
+    relevant_candidates_idx = state_expr[0]['rel_off']
+    text_file.write("\n grid state: %s\n" % state)
+    text_file.write("info: relevant line investments %s\n" % relevant_candidates_idx)
+    for j, comb in state_expr.items():
+        # candidates left free by the pruning are written as '-'
+        row = tuple(1 if c in comb['rel_on'] else 0 if c in comb['rel_off'] else '-'
+                    for c in relevant_candidates_idx)
+        if j == 0:
+            text_file.write("---> no_investment\n")
+        else:
+            text_file.write(f'---> investment in lines {str(comb["rel_on"])} \n')
+        write_expr(comb['islands'], text_file)
+        write_equations(comb['islands'], equation_file, relevant_candidates_idx, row, state)
+
+
 def write_expr(expr, file):
     file.write(f'load_curt =')
     expr_keys = list(expr.keys())
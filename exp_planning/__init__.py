@@ -1 +1,9 @@
-from .model import CapsuleModel
+# CapsuleModel is imported on first use, so that importing the package (e.g. to
+# unpickle data that refers to it) does not load pyomo
+
+
+def __getattr__(name):
+    if name == 'CapsuleModel':
+        from .model import CapsuleModel
+        return CapsuleModel
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
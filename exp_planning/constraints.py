@@ -1,16 +1,22 @@
 from pyomo.environ import Constraint
 from .utils import timeit
+from .matrix import (c14_matrix, c15_matrix, c16_matrix, c18_matrix, c19_matrix, c20_matrix,
+                     c22_23_matrix, c26_matrix, power_matrix)
 
 
 @timeit
-def create_constraints(CapsuleModel):
-    """Add constraints to model. Define rules for constraints in this files"""
+def create_constraints(CapsuleModel, matrix=False):
+    """Add constraints to model. Define rules for constraints in this files.
+    Use matrix to build the operational constraints in matrix form (see matrix.py)."""
     m = CapsuleModel.model
     cvar_constraints(m)
     inv_constraints(m)
-    op_constraints(m)
-    storage_inv_constraints(m)
-    storage_constraints(m)
+    if matrix:
+        op_matrix_constraints(m)
+    else:
+        op_constraints(m)
+    storage_inv_constraints(m, matrix)
+    storage_constraints(m, matrix)
 
 
 def cvar_constraints(m):
@@ -26,12 +32,12 @@ def inv_constraints(m):
     m.c9a = Constraint(m.CJ, rule=c9a)
     m.c9b = Constraint(m.CJ, rule=c9b)
     # m.c9c = Constraint(m.CJ, rule=c9c)
-    m.c10a = Constraint(m.CJEH, rule=c10a)
-    m.c10b = Constraint(m.CJEH, rule=c10b)
-    m.c11a = Constraint(m.CJEH, rule=c11a)
-    m.c11b = Constraint(m.CJEH, rule=c11b)
-    m.c12a = Constraint(m.CJE, rule=c12a)
-    m.c12b = Constraint(m.CJE, rule=c12b)
+    m.c10a = Constraint(m.CIH, rule=c10a)
+    m.c10b = Constraint(m.CIH, rule=c10b)
+    m.c11a = Constraint(m.CIH, rule=c11a)
+    m.c11b = Constraint(m.CIH, rule=c11b)
+    m.c12a = Constraint(m.CI, rule=c12a)
+    m.c12b = Constraint(m.CI, rule=c12b)
 
 
 def op_constraints(m):
@@ -55,19 +61,45 @@ def op_constraints(m):
     m.c20b = Constraint(m.L_bt, m.T, m.D, rule=c20b)
 
 
-def storage_constraints(m):
+def op_matrix_constraints(m):
+    m.c14 = c14_matrix(m)
+    m.c15a = c15_matrix(m, upper=False)
+    m.c15b = c15_matrix(m, upper=True)
+    m.c16a = c16_matrix(m, upper=False)
+    m.c16b = c16_matrix(m, upper=True)
+    m.c18 = c18_matrix(m)
+    if m.FIX_V_SLACK:
+        m.c18b = Constraint(m.T, m.D, m.N_SS, m.N_SS, rule=c18b)
+    m.c19 = c19_matrix(m)
+    m.c20a = c20_matrix(m, upper=False)
+    m.c20b = c20_matrix(m, upper=True)
+
+
+def storage_constraints(m, matrix=False):
     m.c21 = Constraint(m.H, m.D, rule=c21)
-    m.c22_23 = Constraint(m.H, m.T, m.D, rule=c22_23)
+    if matrix:
+        m.c22_23 = c22_23_matrix(m)
+    else:
+        m.c22_23 = Constraint(m.H, m.T, m.D, rule=c22_23)
     m.c24 = Constraint(m.H_e, rule=c24)
-    m.c26 = Constraint(m.H, m.T, m.D, rule=c26)
-    m.c27 = Constraint(m.H_e, m.T, m.D, rule=c27)
-    m.c28 = Constraint(m.H_e, m.T, m.D, rule=c28)
+    if matrix:
+        m.c26 = c26_matrix(m)
+        m.c27 = power_matrix(m, m.H_e, m.p_in, m.p_in_max, invest=False)
+        m.c28 = power_matrix(m, m.H_e, m.p_out, m.p_out_max, invest=False)
+    else:
+        m.c26 = Constraint(m.H, m.T, m.D, rule=c26)
+        m.c27 = Constraint(m.H_e, m.T, m.D, rule=c27)
+        m.c28 = Constraint(m.H_e, m.T, m.D, rule=c28)
 
 
-def storage_inv_constraints(m):
+def storage_inv_constraints(m, matrix=False):
     m.c25 = Constraint(m.H_c, rule=c25)
-    m.c29 = Constraint(m.H_c, m.T, m.D, rule=c29)
-    m.c30 = Constraint(m.H_c, m.T, m.D, rule=c30)
+    if matrix:
+        m.c29 = power_matrix(m, m.H_c, m.p_in, m.p_in_max, invest=True)
+        m.c30 = power_matrix(m, m.H_c, m.p_out, m.p_out_max, invest=True)
+    else:
+        m.c29 = Constraint(m.H_c, m.T, m.D, rule=c29)
+        m.c30 = Constraint(m.H_c, m.T, m.D, rule=c30)
     m.c31 = Constraint(m.H_c, rule=c31)
 
 
@@ -77,24 +109,22 @@ def c2(m, t, d, s):
 
 def c4(m, t, d, s):
     c = m.sc_state[s]
-    # fl = m.f_load[t, d, s]
+    # f_window is the sum of f_load[t+tau, d, s] for tau in S_dur[s] within the day
     return m.l_tds[t, d, s] >= sum(
-        sum(m.l_cje[c, j, e] * m.f_load[t+tau, d, s]
-            for tau in m.S_dur[s] if t + tau <= max(m.T))
-        - sum(m.soc_aux[c, j, e, h] * m.f_bat[h, t, d]
-              for h in m.Hcje[c, j, e])
-        for j in m.Jc[c] for e in m.Ecj[c, j])
+        m.l_ci[c, i] * m.f_window[t, d, s]
+        - sum(m.soc_aux[c, i, h] * m.f_bat[h, t, d]
+              for h in m.Hi[i])
+        for i in m.Ic[c])
 
 
 def c5(m, t, d, s):
     c = m.sc_state[s]
-    # fl = m.f_load[t, d, s]
+    # f_window is the sum of f_load[t+tau, d, s] for tau in S_dur[s] within the day
     return m.l_tds[t, d, s] >= sum(
-        sum(m.l_cje[c, j, e] * m.f_load[t+tau, d, s]
-            for tau in m.S_dur[s] if t + tau <= max(m.T))
-        - sum(m.soc_aux[c, j, e, h]
-              for h in m.Hcje[c, j, e])
-        for j in m.Jc[c] for e in m.Ecj[c, j])
+        m.l_ci[c, i] * m.f_window[t, d, s]
+        - sum(m.soc_aux[c, i, h]
+              for h in m.Hi[i])
+        for i in m.Ic[c])
 
 
 def c7(m, t, d):
@@ -120,28 +150,34 @@ def c9c(m, c, j):
            + sum((m.x_fix_l[l]) for l in m.RLOFFcj[c, j]) <= m.M * (1 - m.x_ind[c, j])
 
 
-def c10a(m, c, j, e, h):
-    return -m.M * (1 - m.x_ind[c, j]) <= m.soc_ref[h] - m.soc_aux[c, j, e, h]
+def island_on(m, c, i):
+    """1 if the investments of state c lead to island i, as only one
+    combination of the state is selected."""
+    return sum(m.x_ind[c, j] for j in m.Jci[c, i])
+
+
+def c10a(m, c, i, h):
+    return -m.M * (1 - island_on(m, c, i)) <= m.soc_ref[h] - m.soc_aux[c, i, h]
 
 
-def c10b(m, c, j, e, h):
-    return m.soc_ref[h] - m.soc_aux[c, j, e, h] <= m.M * (1 - m.x_ind[c, j])
+def c10b(m, c, i, h):
+    return m.soc_ref[h] - m.soc_aux[c, i, h] <= m.M * (1 - island_on(m, c, i))
 
 
-def c11a(m, c, j, e, h):
-    return -m.M * m.x_ind[c, j] <= m.soc_aux[c, j, e, h]
+def c11a(m, c, i, h):
+    return -m.M * island_on(m, c, i) <= m.soc_aux[c, i, h]
 
 
-def c11b(m, c, j, e, h):
-    return m.soc_aux[c, j, e, h] <= m.M * m.x_ind[c, j]
+def c11b(m, c, i, h):
+    return m.soc_aux[c, i, h] <= m.M * island_on(m, c, i)
 
 
-def c12a(m, c, j, e):
-    return -m.M * (1 - m.x_ind[c, j]) <= sum(m.d_peak[i] for i in m.Dcje[c, j, e]) - m.l_cje[c, j, e]
+def c12a(m, c, i):
+    return -m.M * (1 - island_on(m, c, i)) <= m.d_island[i] - m.l_ci[c, i]
 
 
-def c12b(m, c, j, e):
-    return sum(m.d_peak[i] for i in m.Dcje[c, j, e]) - m.l_cje[c, j, e] <= m.M * (1 - m.x_ind[c, j])
+def c12b(m, c, i):
+    return m.d_island[i] - m.l_ci[c, i] <= m.M * (1 - island_on(m, c, i))
 
 
 def c14(m, n, t, d):
@@ -15,7 +15,6 @@ def create_inputs(CapsuleModel, data):
         as tuples to the desired value.
     """
     state_expr = data.state_expr
-    scenarios_time = data.scenarios_time
     bat_prof = data.bat_prof
     storage = data.storage
     lines = data.lines
@@ -31,17 +30,32 @@ def create_inputs(CapsuleModel, data):
     inputs['CJEH'] = [(c, j, e, h) for c in state_expr.keys()
                       for j in state_expr[c].keys() for e in state_expr[c][j]['islands'].keys()
                       for h in state_expr[c][j]['islands'][e]['storage']]
-    inputs['E'] = np.unique([x for z in state_expr.keys() for y in state_expr[z].keys()
-                             for x in state_expr[z][y]['islands'].keys()])
     inputs['Jc'] = dict((x, list(state_expr[x].keys())) for x in state_expr.keys())
-    inputs['Ecj'] = dict(((x, y), list(state_expr[x][y]['islands'].keys()))
-                         for x in state_expr.keys() for y in state_expr[x].keys())
-    inputs['Hcje'] = dict(((x, y, z), list(state_expr[x][y]['islands'][z]['storage']))
-                          for x in state_expr.keys() for y in state_expr[x].keys()
-                          for z in state_expr[x][y]['islands'].keys())
-    inputs['Dcje'] = dict(((x, y, z), list(state_expr[x][y]['islands'][z]['buses_load']))
-                          for x in state_expr.keys() for y in state_expr[x].keys()
-                          for z in state_expr[x][y]['islands'].keys())
+
+    # Unique islands, shared by all the combinations of a state that contain them
+    islands, island_id, Jci = [], {}, {}
+    inputs['island'] = {}
+    for c, j, e in inputs['CJE']:
+        isl = state_expr[c][j]['islands'][e]
+        if len(isl['buses_load']) == 0:  # everything connected, nothing to shed
+            continue
+        key = tuple(sorted(isl['buses_load']))
+        if key not in island_id:
+            island_id[key] = len(islands)
+            islands.append(isl)
+        i = island_id[key]
+        inputs['island'][c, j, e] = i
+        Jci.setdefault((c, i), []).append(j)
+
+    inputs['I'] = list(range(len(islands)))
+    inputs['CI'] = list(Jci.keys())
+    inputs['CIH'] = [(c, i, h) for c, i in inputs['CI'] for h in islands[i]['storage']]
+    inputs['Ic'] = dict((x, []) for x in state_expr.keys())
+    for c, i in inputs['CI']:
+        inputs['Ic'][c].append(i)
+    inputs['Jci'] = Jci
+    inputs['Hi'] = dict((i, list(islands[i]['storage'])) for i in inputs['I'])
+    inputs['Di'] = dict((i, list(islands[i]['buses_load'])) for i in inputs['I'])
     inputs['RLONcj'] = dict(((x, y), list(state_expr[x][y]['rel_on']))
                             for x in state_expr.keys() for y in state_expr[x].keys())
     inputs['RLOFFcj'] = dict(((x, y), list(state_expr[x][y]['rel_off']))
@@ -63,11 +77,26 @@ def create_inputs(CapsuleModel, data):
     inputs['H_n'].update(dict(zip(H, [[i] for i in (H)])))
 
     # Params
-    inputs['f_load'] = dict(zip(
-        list(zip(scenarios_time.t, scenarios_time.d, scenarios_time.scenario)),
-        scenarios_time.load_factor.to_numpy()))
-
-    inputs['f_bat'] = data.bat_prof.set_index(['H', 'T', 'D']).f_bat.to_dict()
+    # f_load is read from the (T, D, S) array when the Param is constructed
+    f_load = data.f_load
+    d_pos = dict((d, n) for n, d in enumerate(data.demand_prof.index))
+    s_pos = dict((s, n) for n, s in enumerate(data.scenarios.index))
+    inputs['f_load'] = lambda m, t, d, s: f_load[t, d_pos[d], s_pos[s]]
+
+    # load of the outage window, sum of f_load over the hours t to t + duration - 1 of the day,
+    # as a difference of cumulative sums over the hours
+    n_t = f_load.shape[0]
+    cum = np.concatenate([np.zeros((1,) + f_load.shape[1:]), np.cumsum(f_load, axis=0)])
+    end = np.minimum(np.arange(n_t)[:, None] + data.scenarios.duration.to_numpy(dtype=int)[None, :], n_t)
+    f_window = np.take_along_axis(cum, np.broadcast_to(end[:, None, :], f_load.shape), axis=0) - cum[:-1]
+    inputs['f_window'] = lambda m, t, d, s: f_window[t, d_pos[d], s_pos[s]]
+
+    if 'H' in bat_prof.columns:
+        inputs['f_bat'] = bat_prof.set_index(['H', 'T', 'D']).f_bat.to_dict()
+    else:
+        # single profile shared by all storage units
+        f_bat = bat_prof.set_index(['T', 'D']).f_bat.to_dict()
+        inputs['f_bat'] = lambda m, h, t, d: f_bat[t, d]
     inputs['c_tr'] = (data.substations_cost.set_index(['substation', 'T', 'D']).c_tr_kwh * 1000
                       / (data.parameters['sbase_mva'] * 1E6)).to_dict()
 
@@ -0,0 +1,242 @@
+"""
+Matrix form of the operational constraints.
+
+The constraints indexed by (n|l|h, t, d) are assembled as whole arrays of
+coefficients and added as MatrixConstraint components, which bypass the
+expression system of Pyomo. Every family keeps the name of its rule in
+constraints.py and has one row per index, in the order of its index sets
+(see MATRIX_INDEX). Coefficients are taken from the parameters when the
+model is built, so these constraints are not rebuilt by update_constraint
+and do not follow later changes of mutable parameters (M in c20).
+
+MatrixConstraint only works up to Pyomo 6.5: from 6.6 on its values() does not
+take the sort argument the LP/MPS writers and appsi pass it, so any write or
+solve fails. With a newer Pyomo, build_model falls back to the rule constraints
+(see MATRIX_PYOMO).
+"""
+from itertools import product
+import numpy as np
+from pyomo.environ import value
+from pyomo.version import version_info
+from pyomo.core.base.matrix_constraint import MatrixConstraint
+
+# first Pyomo version (major, minor) whose writers and solvers can not read a
+# MatrixConstraint
+MATRIX_PYOMO = (6, 6)
+
+
+def matrix_supported():
+    """True if the installed Pyomo can write and solve MatrixConstraint components."""
+    return tuple(version_info[:2]) < MATRIX_PYOMO
+
+
+def var_array(var, shape):
+    """Variables of a dense Var as an object array of the shape of its index sets.
+    The values of a Var over ordered sets are given in the order of its index sets."""
+    return np.fromiter(var.values(), dtype=object, count=len(var)).reshape(shape)
+
+
+def param_array(param, *index):
+    """Values of a Param over the product of the index sets as a float array."""
+    values, default = param.extract_values_sparse(), param.default()
+    if len(index) == 1:
+        return np.array([values.get(i, default) for i in index[0]], dtype=float)
+    return np.array([values.get(i, default) for i in product(*index)], dtype=float).reshape(
+        tuple(len(s) for s in index))
+
+
+def positions(elements, index_set):
+    """Positions of elements in an ordered Pyomo set."""
+    pos = dict((k, n) for n, k in enumerate(index_set))
+    return np.array([pos[k] for k in elements], dtype=np.int64)
+
+
+class LinearRows:
+    """Linear constraints lb <= A x <= ub with one row per index of K x T x D.
+
+    Terms are added for all rows at once, and the rows are assembled in CSR
+    format by constraint.
+
+    Arguments:
+        n_k (int): Size of the first index set.
+        n_t (int): Number of hours.
+        n_d (int): Number of days.
+    """
+
+    def __init__(self, n_k, n_t, n_d):
+        self.shape = (n_k, n_t, n_d)
+        self.rows, self.vars, self.coefs = [], [], []
+
+    def add(self, variables, coef=1.0, k=None, t=None):
+        """Add coef * variables to the rows k (all by default) and hours t (all
+        by default). variables and coef are broadcast to (len(k), len(t), n_d)."""
+        n_k, n_t, n_d = self.shape
+        k = np.arange(n_k) if k is None else np.asarray(k, dtype=np.int64)
+        t = np.arange(n_t) if t is None else np.asarray(t, dtype=np.int64)
+        shape = (len(k), len(t), n_d)
+        rows = (k[:, None, None] * n_t + t[None, :, None]) * n_d + np.arange(n_d)[None, None, :]
+        self.rows.append(rows.ravel())
+        self.vars.append(np.broadcast_to(variables, shape).ravel())
+        self.coefs.append(np.broadcast_to(np.asarray(coef, dtype=float), shape).ravel())
+
+    def constraint(self, lb=None, ub=None):
+        """MatrixConstraint of the rows, lb and ub are broadcast to (K, T, D)."""
+        n = int(np.prod(self.shape))
+        rows, variables, coefs = (np.concatenate(a) for a in (self.rows, self.vars, self.coefs))
+        keep = coefs != 0
+        rows, variables, coefs = rows[keep], variables[keep], coefs[keep]
+        order = np.argsort(rows, kind='stable')
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+        return MatrixConstraint(coefs[order].tolist(), list(range(len(order))), indptr.tolist(),
+                                bounds(lb, n, self.shape), bounds(ub, n, self.shape),
+                                variables[order].tolist())
+
+
+def bounds(b, n, shape):
+    if b is None:
+        return [None] * n
+    return np.broadcast_to(np.asarray(b, dtype=float), shape).ravel().tolist()
+
+
+# index sets of the rows of every family, by name of the constraint
+MATRIX_INDEX = {
+    'c14': ('N_SS', 'T', 'D'),
+    'c15a': ('N', 'T', 'D'),
+    'c15b': ('N', 'T', 'D'),
+    'c16a': ('L_bt', 'T', 'D'),
+    'c16b': ('L_bt', 'T', 'D'),
+    'c18': ('N_SS', 'T', 'D'),
+    'c19': ('N_load', 'T', 'D'),
+    'c20a': ('L_bt', 'T', 'D'),
+    'c20b': ('L_bt', 'T', 'D'),
+    'c22_23': ('H', 'T', 'D'),
+    'c26': ('H', 'T', 'D'),
+    'c27': ('H_e', 'T', 'D'),
+    'c28': ('H_e', 'T', 'D'),
+    'c29': ('H_c', 'T', 'D'),
+    'c30': ('H_c', 'T', 'D'),
+}
+
+
+def shape(m, k):
+    return len(k), len(m.T), len(m.D)
+
+
+def c14_matrix(m):
+    """g_tr[n, t, d] <= g_tr_max[n]"""
+    rows = LinearRows(*shape(m, m.N_SS))
+    rows.add(var_array(m.g_tr, shape(m, m.N_SS)))
+    return rows.constraint(ub=param_array(m.g_tr_max, m.N_SS)[:, None, None])
+
+
+def c15_matrix(m, upper):
+    """v_min[n] <= v[n, t, d] (c15a) or v[n, t, d] <= v_max[n] (c15b)"""
+    rows = LinearRows(*shape(m, m.N))
+    rows.add(var_array(m.v, shape(m, m.N)))
+    if upper:
+        return rows.constraint(ub=param_array(m.v_max, m.N)[:, None, None])
+    return rows.constraint(lb=param_array(m.v_min, m.N)[:, None, None])
+
+
+def f_max_array(m):
+    """y_l[l, t, d] * f_max[l] over L_bt x T x D"""
+    y_l = param_array(m.y_l, m.L_bt, m.T, m.D)
+    return y_l * param_array(m.f_max, m.L_bt)[:, None, None]
+
+
+def c16_matrix(m, upper):
+    """-y_l * f_max <= f_l[l, t, d] (c16a) or f_l[l, t, d] <= y_l * f_max (c16b)"""
+    f_l = var_array(m.f_l, shape(m, m.L_e))
+    rows = LinearRows(*shape(m, m.L_bt))
+    rows.add(f_l[positions(m.L_bt, m.L_e)])
+    if upper:
+        return rows.constraint(ub=f_max_array(m))
+    return rows.constraint(lb=-f_max_array(m))
+
+
+def add_flows(m, rows, nodes):
+    """Add sum(f_l for l in To[n]) - sum(f_l for l in From[n]) to the rows of nodes."""
+    f_l = var_array(m.f_l, shape(m, m.L_e))
+    for incidence, sign in [(m.To, 1.0), (m.From, -1.0)]:
+        pairs = [(k, l) for k, n in enumerate(nodes) for l in incidence[n]]
+        if pairs:
+            k, lines = zip(*pairs)
+            rows.add(f_l[positions(lines, m.L_e)], sign, k=k)
+
+
+def c18_matrix(m):
+    """sum(f_l, To[n]) - sum(f_l, From[n]) + g_tr[n, t, d] == 0"""
+    rows = LinearRows(*shape(m, m.N_SS))
+    add_flows(m, rows, m.N_SS)
+    rows.add(var_array(m.g_tr, shape(m, m.N_SS)))
+    return rows.constraint(lb=0, ub=0)
+
+
+def c19_matrix(m):
+    """sum(f_l, To[n]) - sum(f_l, From[n]) - sum(p_in - p_out, H_n[n])
+    + delta_minus - delta_plus == demand[t, d] * d_peak[n]"""
+    rows = LinearRows(*shape(m, m.N_load))
+    add_flows(m, rows, m.N_load)
+    pairs = [(k, h) for k, n in enumerate(m.N_load) for h in m.H_n[n]]
+    if pairs:
+        k, storage = zip(*pairs)
+        h = positions(storage, m.H)
+        rows.add(var_array(m.p_in, shape(m, m.H))[h], -1.0, k=k)
+        rows.add(var_array(m.p_out, shape(m, m.H))[h], 1.0, k=k)
+    rows.add(var_array(m.delta_minus, shape(m, m.N_load)))
+    rows.add(var_array(m.delta_plus, shape(m, m.N_load)), -1.0)
+    demand = param_array(m.demand, m.T, m.D)
+    load = param_array(m.d_peak, m.N_load)[:, None, None] * demand[None, :, :]
+    return rows.constraint(lb=load, ub=load)
+
+
+def c20_matrix(m, upper):
+    """-M (1 - y_l) <= z length f_l - (alpha_reg v[fr] - v[to]) (c20a)
+    or z length f_l - (alpha_reg v[fr] - v[to]) <= (1 - y_l) M (c20b)"""
+    v = var_array(m.v, shape(m, m.N))
+    f_l = var_array(m.f_l, shape(m, m.L_e))
+    rows = LinearRows(*shape(m, m.L_bt))
+    zl = param_array(m.z, m.L_bt) * param_array(m.length, m.L_bt)
+    rows.add(f_l[positions(m.L_bt, m.L_e)], zl[:, None, None])
+    rows.add(v[positions([m.fr[l] for l in m.L_bt], m.N)], -param_array(m.alpha_reg, m.L_bt)[:, None, None])
+    rows.add(v[positions([m.to[l] for l in m.L_bt], m.N)])
+    y_l = param_array(m.y_l, m.L_bt, m.T, m.D)
+    if upper:
+        return rows.constraint(ub=(1 - y_l) * value(m.M))
+    return rows.constraint(lb=-value(m.M) * (1 - y_l))
+
+
+def c22_23_matrix(m):
+    """soc[h, t, d] - soc[h, t-1, d] - eff[h] p_in + p_out == 0, soc_t0[h, d] for t = 0"""
+    n_h, n_t, n_d = shape(m, m.H)
+    soc = var_array(m.soc, (n_h, n_t, n_d))
+    rows = LinearRows(n_h, n_t, n_d)
+    rows.add(soc)
+    rows.add(var_array(m.soc_t0, (n_h, n_d))[:, None, :], -1.0, t=[0])
+    rows.add(soc[:, :-1, :], -1.0, t=np.arange(1, n_t))
+    rows.add(var_array(m.p_in, (n_h, n_t, n_d)), -param_array(m.eff, m.H)[:, None, None])
+    rows.add(var_array(m.p_out, (n_h, n_t, n_d)))
+    return rows.constraint(lb=0, ub=0)
+
+
+def c26_matrix(m):
+    """soc[h, t, d] - soc_ref[h] f_bat[h, t, d] == 0"""
+    n_h, n_t, n_d = shape(m, m.H)
+    rows = LinearRows(n_h, n_t, n_d)
+    rows.add(var_array(m.soc, (n_h, n_t, n_d)))
+    f_bat = param_array(m.f_bat, m.H, m.T, m.D)
+    rows.add(var_array(m.soc_ref, (n_h,))[:, None, None], -f_bat)
+    return rows.constraint(lb=0, ub=0)
+
+
+def power_matrix(m, storage, var, p_max, invest):
+    """var[h, t, d] <= p_max[h] (c27, c28) or var[h, t, d] - x_sd_var[h] p_max[h] <= 0
+    (c29, c30) for the storage units of storage."""
+    h = positions(storage, m.H)
+    rows = LinearRows(*shape(m, storage))
+    rows.add(var_array(var, shape(m, m.H))[h])
+    p_max = param_array(p_max, storage)[:, None, None]
+    if invest:
+        rows.add(var_array(m.x_sd_var, (len(m.H),))[h][:, None, None], -p_max)
+        return rows.constraint(ub=0)
+    return rows.constraint(ub=p_max)
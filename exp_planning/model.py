@@ -2,17 +2,47 @@ from pyomo.environ import ConcreteModel, Set, Constraint, Param, Var, Objective,
 from pyomo.version import version as pyomo_ver
 from .inputs import create_inputs
 from .sets import create_sets
-from .params import create_params
+from .params import create_params, cost_params
 from .vars import create_vars
 from .constraints import create_constraints
+from .matrix import matrix_supported, MATRIX_PYOMO
 from .objective import create_objective
+from .standard_form import model_matrices
+from .session import SolverSession
+from .solvers import select_solver, solver_options, has_solution, SolveResult
+from .utils import timeit
 import sys
+import time
+import numpy as np
 import pandas as pd
 
 import logging
 logger = logging.getLogger("MAIN")
 
 
+# tables of get_solutions, with the variable they come from and the names of its
+# index columns
+SOLUTION_TABLES = {
+    'cvar': ('phi_cvar', ['T', 'D', 'S']),
+    'value_at_risk': ('zeta', ['T', 'D']),
+    'load_shedding_island': ('l_ci', ['state', 'rel_inv', 'island']),
+    'storage_states': ('soc_aux', ['state', 'rel_inv', 'island', 'H']),
+    'storage_inv': ('soc_ref', ['H']),
+    'state_investment': ('x_ind', ['state', 'rel_inv', 'island']),
+    'line_inv': ('x_fix_l', ['L_c']),
+    'substation': ('g_tr', ['N', 'T', 'D']),
+    'line_flow': ('f_l', ['L_e', 'T', 'D']),
+    'voltage': ('v', ['N', 'T', 'D']),
+    'storage_op': ('p_in', ['H', 'T', 'D']),
+    'storage_t0': ('soc_t0', ['H', 'D']),
+    'imbalance': ('delta_plus', ['N', 'T', 'D']),
+}
+# tables of island variables, by combination (see get_island_solution)
+ISLAND_TABLES = ['load_shedding_island', 'storage_states']
+# tables left out of models without storage
+STORAGE_TABLES = ['storage_states', 'storage_inv', 'storage_op', 'storage_t0']
+
+
 class CapsuleModel:
     """Class template model for Pyomo optimization problem.
 
@@ -33,10 +63,12 @@ class CapsuleModel:
         debug (bool): True for printing all logger, False otherwise (default).
         time (bool): True for printing execution time in logger, False\
         otherwise (default).
+        profiler (profiling.Profiler): Optional profiler that records the\
+        build steps, solves and get_solutions as phases.
 
     """
 
-    def __init__(self, base=None, model=None, debug=False, time=False):
+    def __init__(self, base=None, model=None, debug=False, time=False, profiler=None):
         """Initialize class."""
 
         self.log = logger
@@ -45,6 +77,7 @@ class CapsuleModel:
         #     logger.add(sys.stderr, level="WARNING")
 
         self.time = time
+        self.profiler = profiler
 
         if base is None:
             self.inputs = {}
@@ -70,6 +103,7 @@ class CapsuleModel:
             self.model = model
 
         self.model.FIX_V_SLACK = False
+        self.session = None
 
 
     def __str__(self):
@@ -86,7 +120,8 @@ class CapsuleModel:
         return str_repr
 
     # @logger.catch
-    def build_model(self, data):
+    @timeit
+    def build_model(self, data, matrix=False):
         """Build a model completely.
 
         The model is built using the following order:
@@ -102,12 +137,14 @@ class CapsuleModel:
             for all the sets and parameters of the model. Every element should\
             have a key of the value of a dictionary mapping the set of indexes\
             as tuples to the desired value.
+            matrix (bool): True for building the operational constraints in\
+            matrix form, False otherwise (default).
         """
         self.add_inputs(data)
         self.add_sets(data)
         self.add_params(data)
         self.add_vars(data)
-        self.add_constraints()
+        self.add_constraints(matrix)
         self.add_objective()
 
     def add_inputs(self, inputs):
@@ -144,10 +181,20 @@ class CapsuleModel:
         self.vars = [i.name for i in self.model.component_objects(Var)]
         self.log.info('Variables added successfully.')
 
-    def add_constraints(self):
-        """Add constraints to model."""
+    def add_constraints(self, matrix=False):
+        """Add constraints to model.
+
+        Arguments:
+            matrix (bool): True for building the operational constraints in\
+            matrix form, False otherwise (default). Rule constraints are built\
+            instead with Pyomo 6.6 or later, which can not write or solve them.
+        """
         self.log.info('Adding constraints.')
-        create_constraints(self)
+        if matrix and not matrix_supported():
+            self.log.error(f'Matrix constraints require Pyomo < {".".join(map(str, MATRIX_PYOMO))} '
+                           f'(installed {pyomo_ver}), building the rule constraints instead')
+            matrix = False
+        create_constraints(self, matrix)
         self.constraints = [i.name for i in self.model.component_objects(Constraint)]
         self.log.info('Constraints added successfully.')
 
@@ -163,30 +210,60 @@ class CapsuleModel:
     def update_param(self, param, values):
         """Update a parameter using a dictionary of values.
 
+        Only mutable parameters can be updated (lbd, alpha_cvar, pf, c_imb, M,
+        c_fix_l, c_sd_fix and c_sd_var); the objective and constraints use the
+        new values without being rebuilt.
+
         Arguments:
             param (str): Name of parameter to update.
-            values (dict): Values to replace.
+            values (dict/float): Values to replace, by index, or a single value.
         """
         if param in self.params:
-            getattr(self.model, param)._initialize_from(values)
+            getattr(self.model, param).store_values(values)
+            if self.session is not None:
+                self.session.update_params()
         else:
             self.log.info("Parameter not found.")
 
+    def update_parameters(self, data):
+        """Update the cost and risk parameters from data.parameters.
+
+        Changes of the general parameters in params.COST_PARAMETERS (lambda,
+        alpha_cvar, pf, c_imb_usd_kwh, bigM and discount_rate) do not need
+        building the model again, except bigM for a model built in matrix form.
+
+        Arguments:
+            data (Namespace): Data the model was built with, with new\
+            general parameters.
+        """
+        for param, values in cost_params(self.model, data).items():
+            self.update_param(param, values)
+
     def update_constraint(self, constraint):
         """Update a constraint.
 
         Arguments:
             constraint (str): Name of constraint."""
         if constraint in self.constraints:
-            getattr(self.model, constraint).clear()
-            getattr(self.model, constraint).reconstruct()
+            con = getattr(self.model, constraint)
+            if self.session is not None:
+                self.session.remove_constraints([c for c in con.values() if c.active])
+            rebuild(con)
+            if self.session is not None:
+                self.session.add_constraints([c for c in con.values() if c.active])
         else:
             self.log.info("Constraint not found.")
 
     def update_objective(self):
-        """Update objective function."""
-        self.model.obj._init_sense = 1
-        self.model.obj.reconstruct()
+        """Update objective function.
+
+        The objective is built again from its rule, with the sense it was
+        declared with, e.g. after replacing one of its terms (line_costs,
+        bat_costs, imb_costs, load_shedding_island_costs or cvar_costs).
+        """
+        rebuild(self.model.obj)
+        if self.session is not None:
+            self.session.update_objective()
 
     def update_set(self, sets, values):
         """Update a set using a dictionary of values.
@@ -201,6 +278,8 @@ class CapsuleModel:
                 getattr(self.model, sets).remove(i)
             for i in values:
                 getattr(self.model, sets).add(i)
+            if self.session is not None:
+                self.session.reset()
         else:
             self.log.info("Set not found.")
 
@@ -215,6 +294,8 @@ class CapsuleModel:
         if var in self.vars:
             getattr(self.model, var)[pos].value = value
             getattr(self.model, var)[pos].fixed = True
+            if self.session is not None:
+                self.session.update_vars([getattr(self.model, var)[pos]])
         else:
             self.log.info("Variable not found.")
 
@@ -228,6 +309,8 @@ class CapsuleModel:
         """
         if var in self.vars:
             getattr(self.model, var)[pos].value = value
+            if self.session is not None and getattr(self.model, var)[pos].fixed:
+                self.session.update_vars([getattr(self.model, var)[pos]])
         else:
             self.log.info("Variable not found.")
 
@@ -239,6 +322,8 @@ class CapsuleModel:
             pos (tuple): Index of constraint to deactivate.
         """
         if constraint in self.constraints:
+            if self.session is not None and getattr(self.model, constraint)[pos].active:
+                self.session.remove_constraints([getattr(self.model, constraint)[pos]])
             getattr(self.model, constraint)[pos].deactivate()
         else:
             self.log.info("Constraint not found.")
@@ -252,6 +337,8 @@ class CapsuleModel:
         """
         if var in self.vars:
             getattr(self.model, var)[pos].fixed = False
+            if self.session is not None:
+                self.session.update_vars([getattr(self.model, var)[pos]])
         else:
             self.log.info("Variable not found.")
 
@@ -263,6 +350,8 @@ class CapsuleModel:
             pos (tuple): Index of constraint to deactivate.
         """
         if constraint in self.constraints:
+            if self.session is not None and not getattr(self.model, constraint)[pos].active:
+                self.session.add_constraints([getattr(self.model, constraint)[pos]])
             getattr(self.model, constraint)[pos].activate()
         else:
             self.log.info("Constraint not found.")
@@ -275,29 +364,16 @@ class CapsuleModel:
             variables are returned.
         Returns:
             df (dictionary): Dictionary of DataFrames consisting of variables,\
-            grouped by same index.
+            grouped by same index sets (see var_groups) and named after the\
+            first variable of each group.
         """
         if vars == []:
             vars = self.vars
-        sets = {}
-        for n, var in enumerate(vars):
-            found = False
-            for key in sets:
-                try:
-                    if list(getattr(self.model, key).keys()) == list(getattr(self.model, var).keys()):
-                        sets[key].update([var])
-                        found = True
-                        break
-                except Exception:
-                    found = False
-            if found is False:
-                sets[var] = set([var])
-
         df = {}
-        for key in sets:
-            df[key] = pd.DataFrame.from_dict(getattr(self.model, key).keys())
-            for var in sets[key]:
-                df[key][var] = pd.Series([i.value for i in getattr(self.model, var).values()])
+        for key, group in var_groups(self.model, vars).items():
+            df[key] = index_frame(getattr(self.model, key))
+            for var in group:
+                df[key][var] = var_values(getattr(self.model, var))
 
         return df
 
@@ -327,39 +403,230 @@ class CapsuleModel:
         return results
 
 
-    def solve(self, solver, tee=True):
-        opt = SolverFactory(solver)
-        results = opt.solve(self.model, tee=tee)
-        return results
+    @timeit
+    def solve(self, solver=None, tee=True, persistent=False, **options):
+        """Solve the model.
+
+        Arguments:
+            solver (str/list): Backend (cplex, gurobi, highs, cbc, glpk) or\
+            Pyomo solver name, or list of them to try in order. If none is\
+            given, the first installed solver of solvers.SOLVER_ORDER is used.
+            tee (bool): True for printing the solver log (default).
+            persistent (bool): True for keeping the model in memory in a\
+            SolverSession of an appsi solver (e.g. appsi_highs) or persistent\
+            plugin (e.g. gurobi_persistent), so the next solves only send the\
+            changes made with update_param, update_constraint, fix_var,\
+            deact_constraint, etc. False for writing the model to the\
+            solver at every solve (default).
+            **options: threads, mip_gap, time_limit, presolve (0, 1 or 2)\
+            and options (dict of native options), see solvers.solver_options.
+        Returns:
+            result (SolveResult): Status, objective, gap, nodes and wall time.
+        """
+        backend, solver = select_solver(solver, persistent)
+        native = solver_options(backend, **options)
+        self.log.info(f'Solving with {solver}.')
+        start = time.perf_counter()
+        if persistent:
+            if self.session is None or self.session.solver != solver:
+                self.session = SolverSession(self.model, solver, native)
+            else:
+                self.session.set_options(native)
+            results = self.session.solve(tee)
+            opt = self.session.opt
+        else:
+            opt = SolverFactory(solver)
+            # the solution is loaded only when there is one, appsi solvers raise otherwise
+            results = opt.solve(self.model, tee=tee, options=native, load_solutions=False)
+            if has_solution(results, self.model):
+                self.model.solutions.load_from(results)
+        result = SolveResult.from_results(solver, results, opt, self.model,
+                                          time.perf_counter() - start)
+        self.log.info(str(result))
+        return result
+
+    def to_matrices(self):
+        """Get the built model in standard form (requires scipy).
+
+        Returns:
+            StandardForm: A (scipy sparse), b_lower, b_upper, c, bounds and\
+            integrality as numpy arrays, with the Pyomo names and indices of\
+            the rows and columns. Use its write_mps method to write the model.
+        """
+        return model_matrices(self.model)
+
+    def get_island_solution(self, var, columns):
+        """Get values of an island variable for every combination of the states.
+
+        Islands are shared by the combinations of a state, every combination
+        is given the value of its island (as when the variables were indexed
+        by combination), combinations without an island are 0.
+
+        Arguments:
+            var (str): Island variable, indexed by state and island (l_ci) or\
+            by state, island and storage (soc_aux).
+            columns (dict): Names of the state, combination, island (and storage)\
+            columns.
+        """
+        m = self.model
+        island = self.inputs['island']
+        index = self.inputs['CJE'] if len(columns) == 3 else self.inputs['CJEH']
+        # position of the island of every row in the value array
+        position = dict((k, n) for n, k in enumerate(getattr(m, var).keys()))
+        rows = [position[(idx[0], island[idx[:3]]) + idx[3:]] if idx[:3] in island else -1
+                for idx in index]
+        rows = np.array(rows, dtype=np.int64).reshape(-1)
+        values = np.zeros(len(rows))
+        values[rows >= 0] = var_values(getattr(m, var))[rows[rows >= 0]]
+        df = pd.DataFrame(index, columns=list(columns.values()))
+        df['l_cje' if var == 'l_ci' else var] = values
+        return df
+
+    @timeit
+    def get_solutions(self, data, tables=None):
+        """Get results as a dictionary of DataFrames.
+
+        Arguments:
+            data (Namespace): Data the model was built with.
+            tables (list): Tables to get (see SOLUTION_TABLES), all of them\
+            by default. Only the variables of these tables are read.
+        """
+        tables = self._solution_tables(tables)
+
+        # variables of the tables, with the rest of their groups
+        groups = var_groups(self.model, self.vars)
+        keys = [SOLUTION_TABLES[t][0] for t in tables if t not in ISLAND_TABLES]
+        var_results = self.get_var_solution([v for k in keys for v in groups[k]])
 
-    def get_solutions(self, data):
-        """Get all results as a dictionary of DataFrames."""
-        results = self.get_var_solution()
-        CJE = {0: 'state', 1: 'rel_inv', 2: 'island'}
-        CJEH = {0: 'state', 1: 'rel_inv', 2: 'island', 3: 'H'}
         # Give index and names to solutions DataFrames
-        results['cvar'] = results.pop('phi_cvar').rename(columns={0: 'T', 1: 'D', 2: 'S'})
-        results['value_at_risk'] = results.pop('zeta').rename(columns={0: 'T', 1: 'D'})
-        results['load_shedding_island'] = results.pop('l_cje').rename(columns=CJE)
-        if len(self.model.H) != 0:
-            results['storage_states'] = results.pop('soc_aux').rename(columns=CJEH)
-            results['storage_inv'] = results.pop('soc_ref').rename(columns={0: 'H'})
+        results = {}
+        for t in tables:
+            var, columns = SOLUTION_TABLES[t]
+            if t in ISLAND_TABLES:
+                results[t] = self.get_island_solution(var, dict(enumerate(columns)))
+            else:
+                results[t] = var_results[var].rename(columns=dict(enumerate(columns)))
+        if 'storage_inv' in results:
             results['storage_inv']['x_sd_var_kw'] = results['storage_inv']['x_sd_var'] * data.storage['p_in_max_kw'].to_numpy()
             results['storage_inv']['x_sd_var_kwh'] = results['storage_inv']['x_sd_var_kw'] * data.storage['s_charge'].to_numpy()
-        results['state_investment'] = results.pop('x_ind').rename(columns=CJE)
-        # Add relevant investment from heuristic to results
-        results['state_investment']['rel_on'] = [
-            data.state_expr[i][j]['rel_on'] for i, j in
-            zip(results['state_investment'].state, results['state_investment'].rel_inv)]
-        results['state_investment']['rel_off'] = [
-            data.state_expr[i][j]['rel_off'] for i, j in
-            zip(results['state_investment'].state, results['state_investment'].rel_inv)]
-        results['line_inv'] = results.pop('x_fix_l').rename(columns={0: 'L_c'})
-        results['substation'] = results.pop('g_tr').rename(columns={0: 'N', 1: 'T', 2: 'D'})
-        results['line_flow'] = results.pop('f_l').rename(columns={0: 'L_e', 1: 'T', 2: 'D'})
-        results['voltage'] = results.pop('v').rename(columns={0: 'N', 1: 'T', 2: 'D'})
-        if len(self.model.H) != 0:
-            results['storage_op'] = results.pop('p_in').rename(columns={0: 'H', 1: 'T', 2: 'D'})
-            results['storage_t0'] = results.pop('soc_t0').rename(columns={0: 'H', 1: 'D'})
-        results['imbalance'] = results.pop('delta_plus').rename(columns={0: 'N', 1: 'T', 2: 'D'})
+        if 'state_investment' in results:
+            # Add relevant investment from heuristic to results
+            inv = results['state_investment']
+            rel = pd.DataFrame(
+                [(c, j, e['rel_on'], e['rel_off']) for c, comb in data.state_expr.items()
+                 for j, e in comb.items()],
+                columns=['state', 'rel_inv', 'rel_on', 'rel_off']).set_index(['state', 'rel_inv'])
+            rel = rel.reindex(pd.MultiIndex.from_arrays([inv.state, inv.rel_inv]))
+            inv['rel_on'] = rel.rel_on.to_numpy()
+            inv['rel_off'] = rel.rel_off.to_numpy()
         return results
+
+    def iter_solutions(self, data, tables=None, by_day=True):
+        """Get results table by table, as in get_solutions.
+
+        With by_day, the tables indexed by day (D) are given one day at a\
+        time, so they are never whole in memory. Their index columns are\
+        categorical, with the elements of their sets as categories (as\
+        strings for sets of mixed types, e.g. S).
+
+        Arguments:
+            data (Namespace): Data the model was built with.
+            tables (list): Tables to get (see SOLUTION_TABLES), all of them\
+            by default.
+            by_day (bool): True for giving the tables indexed by day in one\
+            DataFrame per day (default), False for whole tables.
+        Yields:
+            (table, DataFrame): Tables, or the chunks of a table one after\
+            the other.
+        """
+        m = self.model
+        groups = var_groups(m, self.vars)
+        for t in self._solution_tables(tables):
+            var, columns = SOLUTION_TABLES[t]
+            sets = list(getattr(m, var).index_set().subsets(False))
+            shape = [len(s) for s in sets]
+            if (not by_day or t in ISLAND_TABLES or not any(s is m.D for s in sets)
+                    or any(s.dimen != 1 for s in sets) or len(getattr(m, var)) != np.prod(shape)):
+                yield t, self.get_solutions(data, [t])[t]
+                continue
+            day = [s is m.D for s in sets].index(True)
+            categories = [set_categories(s) for s in sets]
+            values = dict((v, var_values(getattr(m, v)).reshape(shape)) for v in groups[var])
+            for k in range(shape[day]):
+                positions = [np.arange(n) for n in shape]
+                positions[day] = np.array([k])
+                codes = product_columns(positions, int(np.prod(shape)) // shape[day])
+                chunk = pd.DataFrame(dict(
+                    (name, pd.Categorical.from_codes(codes[n], categories[n]))
+                    for n, name in enumerate(columns)))
+                for v, val in values.items():
+                    chunk[v] = val.take(k, axis=day).reshape(-1)
+                yield t, chunk
+
+    def _solution_tables(self, tables):
+        """Tables of get_solutions to get, without the storage tables if the\
+        model has no storage."""
+        if tables is None:
+            tables = list(SOLUTION_TABLES)
+        unknown = set(tables) - set(SOLUTION_TABLES)
+        if unknown:
+            raise ValueError(f'Unknown solution tables {sorted(unknown)}')
+        if len(self.model.H) == 0:
+            tables = [t for t in tables if t not in STORAGE_TABLES]
+        return tables
+
+
+def var_groups(model, names):
+    """Variables grouped by index, the variables defined on the same sets (the\
+    same Set objects, in the same order) share a group named after the first\
+    of them in names."""
+    groups, first = {}, {}
+    for name in names:
+        var = getattr(model, name)
+        if var.is_indexed():
+            key = (tuple(id(s) for s in var.index_set().subsets(False)), len(var))
+        else:
+            key = None
+        groups.setdefault(first.setdefault(key, name), []).append(name)
+    return groups
+
+
+def index_frame(var):
+    """Index of a variable as a DataFrame with one column per position. Variables\
+    defined on a product of one dimensional sets get it by repeating the elements\
+    of every set, without reading the index tuples."""
+    sets = list(var.index_set().subsets(False)) if var.is_indexed() else []
+    sizes = [len(s) for s in sets]
+    if not sets or any(s.dimen != 1 for s in sets) or len(var) != int(np.prod(sizes)) or len(var) == 0:
+        return pd.DataFrame.from_dict(list(var.keys()))
+    # pd.Index keeps the types of mixed sets
+    return pd.DataFrame(product_columns([pd.Index(list(s)).to_numpy() for s in sets], len(var)))
+
+
+def product_columns(elements, size):
+    """Columns of the product of arrays of elements, with size rows."""
+    columns, inner = {}, size
+    for n, e in enumerate(elements):
+        inner //= len(e)
+        columns[n] = np.tile(np.repeat(e, inner), size // (inner * len(e)))
+    return columns
+
+
+def set_categories(s):
+    """Elements of a set as categories, strings if they are of mixed types."""
+    categories = pd.Index(list(s))
+    if categories.inferred_type.startswith('mixed'):
+        categories = categories.astype(str)
+    return categories
+
+
+def var_values(var):
+    """Values of a variable in the order of its index, NaN where not set."""
+    return np.array([v.value for v in var.values()], dtype=float).reshape(-1)
+
+
+def rebuild(component):
+    """Construct a component again from its rule (reconstruct was removed in Pyomo 6)."""
+    component.clear()
+    component._constructed = False
+    component.construct()
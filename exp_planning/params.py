@@ -2,6 +2,10 @@ from .utils import Param, timeit
 from itertools import product
 from pyomo.environ import Any
 
+# general parameters that only change the mutable parameters of cost_params, so a
+# built model can be updated with CapsuleModel.update_parameters
+COST_PARAMETERS = ['lambda', 'alpha_cvar', 'pf', 'c_imb_usd_kwh', 'bigM', 'discount_rate']
+
 
 @timeit
 def create_params(CapsuleModel, data):
@@ -20,24 +24,19 @@ def create_params(CapsuleModel, data):
     m.sc_state = Param(m.S, initialize=dict(zip(scenarios.index, scenarios.state)), within=Any)
     m.s_prob = Param(m.S, initialize=scenarios['probability'].to_dict())
     m.f_load = Param(m.T, m.D, m.S, initialize=inputs['f_load'])
+    m.f_window = Param(m.T, m.D, m.S, initialize=inputs['f_window'])
     m.f_bat = Param(m.H, m.T, m.D, initialize=inputs['f_bat'])
 
     m.d_peak = Param(m.N, initialize=dict(zip(bus_tb.index.to_numpy(),
                                               bus_tb.peakDemand_kw * 1E3 / (data.parameters['sbase_mva'] * 1E6))))
+    m.d_island = Param(m.I, initialize=dict((i, sum(m.d_peak[n] for n in m.Di[i])) for i in m.I))
 
-    disc_rate = data.parameters['discount_rate']
-    cand_lines = lines.loc[m.L_c]
-    c_fix_l = cand_lines.c_fix_usd * disc_rate / (1-(cand_lines.lifetime*0+1 + disc_rate).pow(-cand_lines.lifetime))
-    m.c_fix_l = Param(m.L_c, initialize=c_fix_l.to_dict())
+    costs = cost_params(m, data)
+    m.c_fix_l = Param(m.L_c, initialize=costs['c_fix_l'], mutable=True)
     m.alpha_reg = Param(m.L, initialize=lines['alpha'].to_dict())
 
-    cand_stor = storage.loc[m.H]
-    c_SD_fix = cand_stor.c_SD_fix_usd * disc_rate / (1-(cand_stor.lifetime*0+1 + disc_rate).pow(-cand_stor.lifetime))
-    # Cost are in $USD/KWh, translate it to $USD/pu
-    c_SD_var = cand_stor.c_SD_var_usd_kwh * (data.parameters['sbase_mva'] * 1E6) / 1E3 / cand_stor.s_charge
-    c_SD_var = c_SD_var * disc_rate / (1-(cand_stor.lifetime*0+1 + disc_rate).pow(-cand_stor.lifetime))
-    m.c_sd_fix = Param(m.H, initialize=c_SD_fix.to_dict())
-    m.c_sd_var = Param(m.H, initialize=c_SD_var.to_dict())
+    m.c_sd_fix = Param(m.H, initialize=costs['c_sd_fix'], mutable=True)
+    m.c_sd_var = Param(m.H, initialize=costs['c_sd_var'], mutable=True)
 
     m.s = Param(m.H, initialize=storage.loc[m.H].s_charge.to_dict())
     m.eff = Param(m.H, initialize=storage.loc[m.H].eff.to_dict())
@@ -49,11 +48,11 @@ def create_params(CapsuleModel, data):
 
     m.w = Param(m.D, initialize=days['weight'].to_dict())
 
-    m.c_imb = data.parameters['c_imb_usd_kwh'] / 1E3 * data.parameters['sbase_mva'] * 1E6
-    m.M = data.parameters['bigM']
-    m.lbd = data.parameters['lambda']
-    m.alpha_cvar = data.parameters['alpha_cvar']
-    m.pf = data.parameters['pf']
+    m.c_imb = Param(initialize=costs['c_imb'], mutable=True)
+    m.M = Param(initialize=costs['M'], mutable=True)
+    m.lbd = Param(initialize=costs['lbd'], mutable=True)
+    m.alpha_cvar = Param(initialize=costs['alpha_cvar'], mutable=True)
+    m.pf = Param(initialize=costs['pf'], mutable=True)
 
     m.g_tr_max = Param(m.N_SS, initialize=dict(zip(m.N_SS, (bus_tb.loc[list(m.N_SS)].g_tr_max_kw
                                                             * 1E3 / (data.parameters['sbase_mva'] * 1E6)))))
@@ -80,3 +79,29 @@ def create_params(CapsuleModel, data):
 
     demand_prof.columns = list(range(24))
     m.demand = Param(m.T, m.D, initialize=demand_prof.transpose().stack().to_dict())
+
+
+def cost_params(m, data):
+    """Values of the mutable cost and risk parameters, from the general
+    parameters (COST_PARAMETERS and sbase_mva) and the candidates costs."""
+    parameters = data.parameters
+    disc_rate = parameters['discount_rate']
+    cand_lines = data.lines.loc[m.L_c]
+    c_fix_l = cand_lines.c_fix_usd * disc_rate / (1-(cand_lines.lifetime*0+1 + disc_rate).pow(-cand_lines.lifetime))
+
+    cand_stor = data.storage.loc[m.H]
+    c_SD_fix = cand_stor.c_SD_fix_usd * disc_rate / (1-(cand_stor.lifetime*0+1 + disc_rate).pow(-cand_stor.lifetime))
+    # Cost are in $USD/KWh, translate it to $USD/pu
+    c_SD_var = cand_stor.c_SD_var_usd_kwh * (parameters['sbase_mva'] * 1E6) / 1E3 / cand_stor.s_charge
+    c_SD_var = c_SD_var * disc_rate / (1-(cand_stor.lifetime*0+1 + disc_rate).pow(-cand_stor.lifetime))
+
+    return {
+        'c_fix_l': c_fix_l.to_dict(),
+        'c_sd_fix': c_SD_fix.to_dict(),
+        'c_sd_var': c_SD_var.to_dict(),
+        'c_imb': parameters['c_imb_usd_kwh'] / 1E3 * parameters['sbase_mva'] * 1E6,
+        'M': parameters['bigM'],
+        'lbd': parameters['lambda'],
+        'alpha_cvar': parameters['alpha_cvar'],
+        'pf': parameters['pf'],
+    }
@@ -0,0 +1,177 @@
+"""
+Persistent solver session of a built model.
+
+The model is sent once to an in-memory solver interface, either an appsi
+solver (appsi_highs, appsi_gurobi, appsi_cplex, appsi_cbc) or a persistent
+plugin (gurobi_persistent, cplex_persistent, xpress_persistent). Afterwards only
+the changes made through the CapsuleModel methods (update_param,
+update_constraint, update_objective, fix_var, deact_constraint, ...) are
+pushed to it, so the model is not written and read again. The solver keeps its basis between
+solves, and MIP solves start from the previous solution.
+"""
+from pyomo.environ import Objective, Var, SolverFactory
+from pyomo.contrib.appsi.base import SolverFactory as AppsiFactory
+from .solvers import BACKENDS, appsi_name, has_solution
+
+import logging
+logger = logging.getLogger("MAIN")
+
+
+class SolverSession:
+    """Persistent solver of a model.
+
+    Arguments:
+        model (pyomo.environ.ConcreteModel): Built model.
+        solver (str): Name of an appsi solver (appsi_highs, ...) or persistent\
+        plugin, or backend of solvers.BACKENDS (its persistent interface).
+        options (dict): Native options of the solver.
+    """
+
+    def __init__(self, model, solver='appsi_highs', options=None):
+        self.model = model
+        if BACKENDS.get(solver, {}).get('persistent'):
+            solver = BACKENDS[solver]['persistent']
+        self.solver = solver
+        self.appsi = appsi_name(solver) is not None
+        if self.appsi:
+            self.opt = AppsiFactory(appsi_name(solver))
+            # changes are pushed by the session, the model is not scanned at every solve
+            config = self.opt.update_config
+            for check in ['check_for_new_or_removed_constraints', 'check_for_new_or_removed_vars',
+                          'check_for_new_or_removed_params', 'check_for_new_objective',
+                          'update_constraints', 'update_vars', 'update_params',
+                          'update_named_expressions', 'update_objective']:
+                setattr(config, check, False)
+            # fixed variables are sent as bounds, so fixing them does not rebuild rows
+            config.treat_fixed_vars_as_params = False
+            # the solution is loaded by solve only when there is one, appsi raises otherwise
+            self.opt.config.load_solution = False
+        elif solver.endswith('_persistent'):
+            self.opt = SolverFactory(solver)
+        else:
+            raise ValueError(f'{solver} is not a persistent solver, use an appsi solver '
+                             f'(appsi_highs, appsi_gurobi, ...) or a *_persistent plugin')
+        self.set_options(options)
+        self.mip = False
+        self.start = None
+        self.reset()
+
+    def set_options(self, options):
+        """Replace the native options of the solver."""
+        if self.appsi:
+            setattr(self.opt, self.solver[len('appsi_'):] + '_options', dict(options or {}))
+        else:
+            self.opt.options.clear()
+            self.opt.options.update(options or {})
+
+    def reset(self):
+        """Send the whole model at the next solve (e.g. after changing a set)."""
+        self.loaded = False
+        self.start = None
+        self.clear_changes()
+
+    def clear_changes(self):
+        self.removed = self.added = 0
+        self.vars = {}
+        self.params = self.objective = False
+
+    def remove_constraints(self, cons):
+        """Remove constraints from the solver, before they are deactivated or\
+        deleted from the model."""
+        if not self.loaded:
+            return
+        cons = list(cons)
+        if self.appsi:
+            self.opt.remove_constraints(cons)
+        else:
+            for c in cons:
+                self.opt.remove_constraint(c)
+        self.removed += len(cons)
+
+    def add_constraints(self, cons):
+        """Add constraints activated or added to the model to the solver."""
+        if not self.loaded:
+            return
+        cons = list(cons)
+        if self.appsi:
+            self.opt.add_constraints(cons)
+        else:
+            for c in cons:
+                self.opt.add_constraint(c)
+        self.added += len(cons)
+
+    def update_vars(self, variables):
+        """Record variables with new bounds or fixed status."""
+        if self.loaded:
+            self.vars.update((id(v), v) for v in variables)
+
+    def update_params(self):
+        """Record new values of mutable parameters."""
+        self.params = self.loaded
+
+    def update_objective(self):
+        """Record a new objective expression."""
+        self.objective = self.loaded
+
+    def solve(self, tee=True):
+        """Solve the model, pushing the changes recorded since the last solve.
+
+        Arguments:
+            tee (bool): True for printing the solver log (default).
+        Returns:
+            Results of the solver interface.
+        """
+        if self.loaded and self.params and not self.appsi:
+            # persistent plugins do not track parameters
+            logger.info('Parameters changed, sending the whole model to the solver.')
+            self.reset()
+        if not self.loaded:
+            self.mip = any(v.is_integer() for v in self.model.component_data_objects(Var)
+                           if not v.fixed)
+            self.opt.set_instance(self.model)
+            self.loaded = True
+            warmstart = False
+        else:
+            self._push()
+            warmstart = self.mip
+
+        if self.appsi:
+            self.opt.config.stream_solver = tee
+            if warmstart and self.solver == 'appsi_highs':
+                self._highs_start()
+            results = self.opt.solve(self.model)
+            if has_solution(results, self.model):
+                results.solution_loader.load_vars()
+            if self.solver == 'appsi_highs' and self.mip:
+                solution = self.opt._solver_model.getSolution()
+                self.start = list(solution.col_value) if solution.value_valid else None
+        else:
+            results = self.opt.solve(tee=tee, warmstart=warmstart, save_results=False,
+                                     load_solutions=False)
+            if has_solution(results, self.model):
+                self.opt.load_vars()
+        self.clear_changes()
+        return results
+
+    def _push(self):
+        logger.info(f'Updating solver: {self.removed} constraints removed, {self.added} added, '
+                    f'{len(self.vars)} variables changed.')
+        if self.appsi:
+            self.opt.update_variables(list(self.vars.values()))
+            if self.params:
+                self.opt.update_params()
+        else:
+            for v in self.vars.values():
+                self.opt.update_var(v)
+        if self.objective:
+            self.opt.set_objective(next(self.model.component_data_objects(Objective, active=True)))
+
+    def _highs_start(self):
+        """Give the previous solution of HiGHS as the starting point of the MIP."""
+        import highspy
+        highs = self.opt._solver_model
+        if self.start is not None and len(self.start) == highs.getNumCol():
+            start = highspy.HighsSolution()
+            start.col_value = self.start
+            start.value_valid = True
+            highs.setSolution(start)
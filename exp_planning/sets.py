@@ -36,17 +36,19 @@ def create_sets(CapsuleModel, data):
     m.R = Set(initialize=inputs['R'])
 
     m.J = Set(initialize=inputs['J'])
-    m.E = Set(initialize=inputs['E'])
+    # Unique islands
+    m.I = Set(initialize=inputs['I'])
 
     m.CJ = Set(initialize=inputs['CJ'])
-    m.CJE = Set(initialize=inputs['CJE'])
-    m.CJEH = Set(initialize=inputs['CJEH'])
+    m.CI = Set(initialize=inputs['CI'])
+    m.CIH = Set(initialize=inputs['CIH'])
 
     # Index sets for summation only
     m.Jc = Set(m.C, initialize=inputs['Jc'])
-    m.Ecj = Set(m.C, m.J, initialize=inputs['Ecj'])
-    m.Hcje = Set(m.C, m.J, m.E, initialize=inputs['Hcje'])
-    m.Dcje = Set(m.C, m.J, m.E, initialize=inputs['Dcje'])
+    m.Ic = Set(m.C, initialize=inputs['Ic'])
+    m.Jci = Set(m.CI, initialize=inputs['Jci'])
+    m.Hi = Set(m.I, initialize=inputs['Hi'])
+    m.Di = Set(m.I, initialize=inputs['Di'])
     m.RLONcj = Set(m.C, m.J, initialize=inputs['RLONcj'])
     m.RLOFFcj = Set(m.C, m.J, initialize=inputs['RLOFFcj'])
 
@@ -0,0 +1,249 @@
+"""
+Solver backends.
+
+Every backend is a MILP solver with the names of its Pyomo interfaces and of
+its options. select_solver picks the first installed backend of a list
+(SOLVER_ORDER by default), solver_options maps the common options (threads,
+mip_gap, time_limit, presolve) to the native names of the backend, and the
+outcome of any solve is summarized in a SolveResult.
+"""
+import math
+from functools import lru_cache
+from pyomo.environ import SolverFactory, Objective, value
+from pyomo.contrib.appsi.base import SolverFactory as AppsiFactory
+
+import logging
+logger = logging.getLogger("MAIN")
+
+# termination conditions of the legacy interfaces that can come with a solution
+SOLUTION_STATUS = ['optimal', 'maxTimeLimit', 'maxIterations', 'feasible', 'other']
+
+# backends tried when no solver is given
+SOLVER_ORDER = ['cplex', 'gurobi', 'highs', 'cbc', 'glpk']
+
+# Pyomo interfaces (file based or in-memory, persistent) and native options of
+# every backend, presolve maps the level (0 off, 1 default, 2 aggressive) to options
+BACKENDS = {
+    'cplex': {
+        'solver': 'cplex', 'persistent': 'cplex_persistent',
+        'threads': 'threads', 'mip_gap': 'mip_tolerances_mipgap', 'time_limit': 'timelimit',
+        'presolve': {0: {'preprocessing_presolve': 0}, 1: {}, 2: {'preprocessing_presolve': 1}}},
+    'gurobi': {
+        'solver': 'gurobi', 'persistent': 'appsi_gurobi',
+        'threads': 'Threads', 'mip_gap': 'MIPGap', 'time_limit': 'TimeLimit',
+        'presolve': {0: {'Presolve': 0}, 1: {}, 2: {'Presolve': 2}}},
+    'highs': {
+        'solver': 'appsi_highs', 'persistent': 'appsi_highs',
+        'threads': 'threads', 'mip_gap': 'mip_rel_gap', 'time_limit': 'time_limit',
+        'presolve': {0: {'presolve': 'off'}, 1: {}, 2: {'presolve': 'on'}}},
+    'cbc': {
+        'solver': 'cbc', 'persistent': 'appsi_cbc',
+        'threads': 'threads', 'mip_gap': 'ratioGap', 'time_limit': 'seconds',
+        'presolve': {0: {'presolve': 'off'}, 1: {}, 2: {'presolve': 'more'}}},
+    'glpk': {
+        'solver': 'glpk', 'persistent': None,
+        'threads': None, 'mip_gap': 'mipgap', 'time_limit': 'tmlim',
+        'presolve': {0: {'nopresol': None}, 1: {}, 2: {'presol': None}}},
+}
+
+
+@lru_cache(maxsize=None)
+def is_available(solver):
+    """True if the Pyomo solver is installed (and licensed)."""
+    try:
+        if appsi_name(solver) is not None:
+            # Availability is negative for a bad version or license, which the
+            # legacy interface of SolverFactory turns into True
+            return AppsiFactory(appsi_name(solver)).available() > 0
+        opt = SolverFactory(solver)
+        return bool(opt.available(exception_flag=False)) and bool(opt.license_is_valid())
+    except Exception:
+        return False
+
+
+def available_solvers():
+    """Backends installed in this system, in SOLVER_ORDER."""
+    return [b for b in SOLVER_ORDER if is_available(BACKENDS[b]['solver'])]
+
+
+def appsi_name(solver):
+    """Name of an appsi solver (e.g. appsi_highs) in the appsi SolverFactory, None
+    if it is not one. Pyomo registers them as appsi_<name> up to 6.7 and as <name>
+    from 6.8 on, where the legacy SolverFactory keeps the appsi_ prefix."""
+    if not solver.startswith('appsi_'):
+        return None
+    for name in [solver, solver[len('appsi_'):]]:
+        if name in AppsiFactory:
+            return name
+    return None
+
+
+def backend_of(solver):
+    """Backend of a Pyomo solver name (e.g. appsi_highs, cplex_direct), None if unknown."""
+    name = solver[len('appsi_'):] if solver.startswith('appsi_') else solver.split('_')[0]
+    return name if name in BACKENDS else None
+
+
+def select_solver(solver=None, persistent=False):
+    """Choose the solver of a solve.
+
+    Arguments:
+        solver (str/list): Backend (see BACKENDS) or Pyomo solver name, or\
+        list of them to try in order. If none is given, SOLVER_ORDER is used.
+        persistent (bool): True for the persistent interface of the backend.
+    Returns:
+        (backend, Pyomo solver name) of the first installed solver.
+    """
+    candidates = SOLVER_ORDER if solver is None else [solver] if isinstance(solver, str) else solver
+    for name in candidates:
+        if name in BACKENDS:
+            backend, pyomo_name = name, BACKENDS[name]['persistent' if persistent else 'solver']
+            if pyomo_name is None:
+                logger.info(f'{name} has no persistent interface, skipping it.')
+                continue
+        else:
+            backend, pyomo_name = backend_of(name), name
+        if is_available(pyomo_name):
+            if solver is not None and name != candidates[0]:
+                logger.warning(f'{candidates[0]} is not available, using {name}.')
+            return backend, pyomo_name
+    raise RuntimeError(f'None of the solvers {", ".join(candidates)} is available')
+
+
+def solver_options(backend, threads=None, mip_gap=None, time_limit=None, presolve=None,
+                   options=None):
+    """Native options of a backend.
+
+    Arguments:
+        backend (str): Backend (see BACKENDS), None for a solver without\
+        known options (only options is used).
+        threads (int): Number of threads.
+        mip_gap (float): Relative MIP gap to stop at.
+        time_limit (float): Time limit in seconds.
+        presolve (int/bool): Presolve level, 0 (off), 1 (solver default)\
+        or 2 (aggressive).
+        options (dict): Native options, added as given.
+    """
+    common = {'threads': threads, 'mip_gap': mip_gap, 'time_limit': time_limit}
+    native = {}
+    if any(v is not None for v in common.values()) or presolve is not None:
+        if backend is None:
+            raise ValueError('Unknown solver, give its options in the options argument')
+        names = BACKENDS[backend]
+        for key, val in common.items():
+            if val is None:
+                continue
+            if names[key] is None:
+                logger.warning(f'{backend} does not have a {key} option, ignoring it.')
+            elif backend == 'glpk' and key == 'time_limit':
+                native[names[key]] = int(math.ceil(val))
+            else:
+                native[names[key]] = val
+        if presolve is not None:
+            native.update(names['presolve'][int(presolve)])
+    native.update(options or {})
+    return native
+
+
+class SolveResult:
+    """Outcome of a solve, the same for every backend.
+
+    Attributes:
+        solver (str): Pyomo solver used.
+        status (str): Termination condition (optimal, maxTimeLimit, infeasible...).
+        objective (float): Objective of the solution found, None without solution.
+        bound (float): Best bound of the objective, None if not given by the solver.
+        gap (float): Relative gap between objective and bound.
+        nodes (int): Branch and bound nodes, None if not given by the solver.
+        wall_time (float): Seconds of the solve, including sending the model.
+        results: Results of the Pyomo interface.
+    """
+
+    def __init__(self, solver, status, objective, bound, nodes, wall_time, results):
+        self.solver = solver
+        self.status = status
+        self.objective, self.bound = objective, bound
+        self.gap = (None if objective is None or bound is None else
+                    abs(objective - bound) / max(abs(objective), 1e-10))
+        self.nodes = nodes
+        self.wall_time = wall_time
+        self.results = results
+
+    @property
+    def optimal(self):
+        return self.status == 'optimal'
+
+    def __repr__(self):
+        gap = 'n/a' if self.gap is None else f'{self.gap:.2%}'
+        return (f'SolveResult({self.solver}: {self.status}, objective {self.objective}, '
+                f'gap {gap}, nodes {self.nodes}, {self.wall_time:.1f} s)')
+
+    @classmethod
+    def from_results(cls, solver, results, opt, model, wall_time):
+        """Summary of the results of a Pyomo solver, legacy or appsi.
+
+        Arguments:
+            solver (str): Pyomo solver name.
+            results: Results returned by the solver.
+            opt: Solver interface.
+            model (pyomo.environ.ConcreteModel): Solved model.
+            wall_time (float): Seconds of the solve.
+        """
+        objective = next(model.component_data_objects(Objective, active=True))
+        if hasattr(results, 'best_feasible_objective'):
+            status = results.termination_condition.name
+            obj, bound = results.best_feasible_objective, results.best_objective_bound
+        else:
+            status = str(results.solver.termination_condition)
+            minimize = objective.sense == 1
+            bound = results.problem.lower_bound if minimize else results.problem.upper_bound
+            obj = None
+            if has_solution(results, model):
+                obj = value(objective, exception=False)
+        return cls(solver, status, finite(obj), finite(bound), node_count(results, opt),
+                   wall_time, results)
+
+
+def has_solution(results, model):
+    """True if a solve found a feasible solution, which can be loaded into the model.
+
+    Arguments:
+        results: Results of a legacy or appsi solver interface, solved without\
+        loading the solution.
+        model (pyomo.environ.ConcreteModel): Solved model.
+    """
+    if hasattr(results, 'best_feasible_objective'):
+        return results.best_feasible_objective is not None
+    if str(results.solver.termination_condition) not in SOLUTION_STATUS:
+        return False
+    if len(results.solution) > 0:
+        return True
+    # persistent plugins do not save the solution in the results, the bound on
+    # the objective from the side of the incumbent is only set when there is one
+    minimize = next(model.component_data_objects(Objective, active=True)).sense == 1
+    return finite(results.problem.upper_bound if minimize else results.problem.lower_bound) is not None
+
+
+def finite(x):
+    try:
+        x = float(x)
+    except (TypeError, ValueError):
+        return None
+    return x if math.isfinite(x) else None
+
+
+def node_count(results, opt):
+    """Branch and bound nodes from the solver model of in-memory interfaces, or
+    from the results of file based ones."""
+    model = getattr(opt, '_solver_model', None)
+    getters = [lambda: model.getInfo().mip_node_count,  # HiGHS
+               lambda: model.NodeCount,  # Gurobi
+               lambda: model.solution.progress.get_num_nodes_processed(),  # CPLEX
+               lambda: results.solver.statistics.branch_and_bound.number_of_bounded_subproblems]
+    for get in getters:
+        try:
+            nodes = int(get())
+        except Exception:
+            continue
+        return nodes if nodes >= 0 else None
+    return None
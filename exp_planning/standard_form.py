@@ -0,0 +1,240 @@
+"""
+Standard form of a built model.
+
+The model is exported as
+
+    min  c x + c0
+    s.t. b_lower <= A x <= b_upper
+         lb <= x <= ub, x integer where integer is True
+
+with A as a scipy sparse matrix and the rest as numpy arrays, together with
+the names of the variables and constraints and the Pyomo indices they come
+from. Matrix constraints (see matrix.py) are read directly from their
+arrays, the other constraints are read once with generate_standard_repn.
+"""
+from itertools import product
+import numpy as np
+from pyomo.environ import Var, Constraint, Objective, value, maximize
+from pyomo.repn import generate_standard_repn
+from pyomo.core.base.matrix_constraint import MatrixConstraint
+from pyomo.core.base.component_namer import index_repr
+from pyomo.version import version as pyomo_ver
+from .matrix import MATRIX_INDEX, MATRIX_PYOMO, matrix_supported
+
+# private arrays of a MatrixConstraint in the Pyomo versions that can solve it
+MATRIX_ARRAYS = ['_A_data', '_A_indices', '_A_indptr', '_x', '_lower', '_upper']
+
+
+class StandardForm:
+    """Arrays of a model in standard form.
+
+    Attributes:
+        A (scipy.sparse.csr_matrix): Constraint matrix, one row per constraint.
+        b_lower, b_upper (np.ndarray): Row bounds, -inf/inf when missing.
+        c (np.ndarray): Objective coefficients, for minimization.
+        c0 (float): Objective constant.
+        lb, ub (np.ndarray): Variable bounds, -inf/inf when missing.
+        integer (np.ndarray): True for integer (and binary) variables.
+        var_index, con_index (list): (component, index) of columns and rows.
+        var_names, con_names (list): Names of columns and rows in Pyomo\
+        notation (e.g. x_fix_l[3]), built when first used.
+        sense (int): 1 if the model minimizes, -1 if it maximizes (c is negated).
+    """
+
+    def __init__(self, A, b_lower, b_upper, c, c0, lb, ub, integer,
+                 var_index, con_index, sense=1):
+        self.A = A
+        self.b_lower, self.b_upper = b_lower, b_upper
+        self.c, self.c0 = c, c0
+        self.lb, self.ub = lb, ub
+        self.integer = integer
+        self.var_index, self.con_index = var_index, con_index
+        self.sense = sense
+
+    @property
+    def var_names(self):
+        return [index_name(*i) for i in self.var_index]
+
+    @property
+    def con_names(self):
+        return [index_name(*i) for i in self.con_index]
+
+    def __repr__(self):
+        return (f'StandardForm with {self.A.shape[0]} rows, {self.A.shape[1]} columns '
+                f'({int(self.integer.sum())} integer) and {self.A.nnz} nonzeros')
+
+    def write_mps(self, filename, name='REPAIR'):
+        """Write the arrays as an MPS file, with rows named R<row> and columns
+        C<column> (see con_names and var_names for the Pyomo names)."""
+        A = self.A.tocsc()
+        lo, up = self.b_lower, self.b_upper
+        equal = lo == up
+        has_lo, has_up = np.isfinite(lo), np.isfinite(up)
+        row_type = np.where(equal, 'E', np.where(has_lo, 'G', np.where(has_up, 'L', 'N')))
+        rhs = np.where(has_lo, lo, up)
+        ranged = has_lo & has_up & ~equal
+
+        with open(filename, 'w') as f:
+            f.write(f'NAME {name}\nROWS\n N OBJ\n')
+            f.write(''.join(f' {t} R{i}\n' for i, t in enumerate(row_type)))
+            f.write('COLUMNS\n')
+            in_int = False
+            for j in range(A.shape[1]):
+                if self.integer[j] != in_int:
+                    in_int = bool(self.integer[j])
+                    f.write(f" MARKER 'MARKER' '{'INTORG' if in_int else 'INTEND'}'\n")
+                start, end = A.indptr[j], A.indptr[j + 1]
+                lines = [f' C{j} R{i} {a!r}\n' for i, a in
+                         zip(A.indices[start:end].tolist(), A.data[start:end].tolist())]
+                if self.c[j] != 0 or not lines:
+                    lines.insert(0, f' C{j} OBJ {float(self.c[j])!r}\n')
+                f.write(''.join(lines))
+            if in_int:
+                f.write(" MARKER 'MARKER' 'INTEND'\n")
+            f.write('RHS\n')
+            if self.c0 != 0:
+                f.write(f' RHS OBJ {-float(self.c0)!r}\n')
+            f.write(''.join(f' RHS R{i} {v!r}\n' for i, v in
+                            zip(np.flatnonzero(rhs != 0).tolist(), rhs[rhs != 0].tolist())
+                            if row_type[i] != 'N'))
+            if ranged.any():
+                f.write('RANGES\n')
+                f.write(''.join(f' RNG R{i} {v!r}\n' for i, v in
+                                zip(np.flatnonzero(ranged).tolist(), (up - lo)[ranged].tolist())))
+            f.write('BOUNDS\n')
+            f.write(''.join(bound_lines(self.lb, self.ub)))
+            f.write('ENDATA\n')
+
+
+def index_name(component, index):
+    """Name of the element index of a component, as given by Pyomo."""
+    if index is None:
+        return component
+    return component + index_repr(index)
+
+
+def bound_lines(lb, ub):
+    """BOUNDS section of the MPS format, MPS columns default to [0, inf)."""
+    for j, (lo, up) in enumerate(zip(lb.tolist(), ub.tolist())):
+        if lo == up:
+            yield f' FX BND C{j} {lo!r}\n'
+            continue
+        if lo == -np.inf:
+            yield f' FR BND C{j}\n' if up == np.inf else f' MI BND C{j}\n'
+        elif lo != 0:
+            yield f' LO BND C{j} {lo!r}\n'
+        if up != np.inf:
+            yield f' UP BND C{j} {up!r}\n'
+        elif lo == 0:
+            # integer columns inside markers would get an upper bound of 1 otherwise
+            yield f' PL BND C{j}\n'
+
+
+def model_matrices(model):
+    """StandardForm of a linear Pyomo model.
+
+    Arguments:
+        model (pyomo.environ.ConcreteModel): Built model, with a single\
+        active objective.
+    """
+    from scipy.sparse import csr_matrix
+
+    variables, var_index = [], []
+    for var in model.component_objects(Var, descend_into=True):
+        for k, v in var.items():
+            variables.append(v)
+            var_index.append((var.name, k))
+    column = dict((id(v), j) for j, v in enumerate(variables))
+    lb = np.array([-np.inf if v.lb is None else v.lb for v in variables], dtype=float)
+    ub = np.array([np.inf if v.ub is None else v.ub for v in variables], dtype=float)
+    fixed = np.array([v.fixed for v in variables], dtype=bool)
+    fixed_value = np.array([value(v) if v.fixed else 0 for v in variables], dtype=float)
+    lb[fixed], ub[fixed] = fixed_value[fixed], fixed_value[fixed]
+
+    rows, cols, coefs, b_lower, b_upper, con_index = [], [], [], [], [], []
+    n_rows = 0
+    for con in model.component_objects(Constraint, active=True, descend_into=True):
+        if isinstance(con, MatrixConstraint):
+            r, c, a, lo, up, index = matrix_rows(con, column, fixed, fixed_value, model)
+        else:
+            r, c, a, lo, up, index = [], [], [], [], [], []
+            for k, data in con.items():
+                if not data.active:
+                    continue
+                repn = linear_repn(data.body, (con.name, k))
+                const = value(repn.constant)
+                r += [len(lo)] * len(repn.linear_vars)
+                c += [column[id(v)] for v in repn.linear_vars]
+                a += [value(x) for x in repn.linear_coefs]
+                lo.append(-np.inf if data.lower is None else value(data.lower) - const)
+                up.append(np.inf if data.upper is None else value(data.upper) - const)
+                index.append(k)
+        rows.append(np.asarray(r, dtype=np.int64) + n_rows)
+        cols.append(np.asarray(c, dtype=np.int64))
+        coefs.append(np.asarray(a, dtype=float))
+        b_lower.append(np.asarray(lo, dtype=float))
+        b_upper.append(np.asarray(up, dtype=float))
+        con_index += [(con.name, k) for k in index]
+        n_rows += len(lo)
+
+    A = csr_matrix((np.concatenate(coefs), (np.concatenate(rows), np.concatenate(cols))),
+                   shape=(n_rows, len(variables)))
+    A.sum_duplicates()
+
+    objective = next(model.component_data_objects(Objective, active=True, descend_into=True))
+    repn = linear_repn(objective.expr, (objective.name, None))
+    sense = -1 if objective.sense == maximize else 1
+    c = np.zeros(len(variables))
+    for v, a in zip(repn.linear_vars, repn.linear_coefs):
+        c[column[id(v)]] += sense * value(a)
+
+    return StandardForm(
+        A, np.concatenate(b_lower), np.concatenate(b_upper), c, sense * value(repn.constant),
+        lb, ub, np.array([v.is_integer() or v.is_binary() for v in variables], dtype=bool),
+        var_index, con_index, sense)
+
+
+def linear_repn(expr, index):
+    repn = generate_standard_repn(expr, compute_values=True)
+    if not repn.is_linear():
+        raise ValueError(f'{index_name(*index)} is not linear, the model can not be '
+                         f'exported in standard form')
+    return repn
+
+
+def matrix_rows(con, column, fixed, fixed_value, model):
+    """Rows of a MatrixConstraint in coordinate format, fixed variables are moved
+    to the bounds and deactivated rows are left out. Rows are indexed by their
+    MATRIX_INDEX indices when known."""
+    # MatrixConstraint has no public API for its arrays and reading its rows one
+    # by one through body would take as long as building the model with
+    # expressions, so its private arrays are read, as they are up to Pyomo 6.5
+    missing = [a for a in MATRIX_ARRAYS if not hasattr(con, a)]
+    if not matrix_supported() or missing:
+        raise RuntimeError(f'{con.name} can not be read with Pyomo {pyomo_ver}, matrix constraints '
+                           f'require Pyomo < {".".join(map(str, MATRIX_PYOMO))}')
+    indptr = np.asarray(con._A_indptr, dtype=np.int64)
+    n = len(indptr) - 1
+    cols = np.array([column[id(v)] for v in con._x], dtype=np.int64)[np.asarray(con._A_indices, dtype=np.int64)]
+    coefs = np.asarray(con._A_data, dtype=float)
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    lo = np.array([-np.inf if b is None else b for b in con._lower], dtype=float)
+    up = np.array([np.inf if b is None else b for b in con._upper], dtype=float)
+    is_fixed = fixed[cols]
+    if is_fixed.any():
+        shift = np.bincount(rows[is_fixed], weights=coefs[is_fixed] * fixed_value[cols[is_fixed]],
+                            minlength=n)
+        lo, up = lo - shift, up - shift
+        rows, cols, coefs = rows[~is_fixed], cols[~is_fixed], coefs[~is_fixed]
+    if con.local_name in MATRIX_INDEX:
+        index = list(product(*[getattr(model, s) for s in MATRIX_INDEX[con.local_name]]))
+    else:
+        index = list(range(n))
+    active = np.fromiter((data.active for data in con.values()), dtype=bool, count=n)
+    if not active.all():
+        # rows are numbered again among the active ones
+        keep = active[rows]
+        rows, cols, coefs = (np.cumsum(active) - 1)[rows[keep]], cols[keep], coefs[keep]
+        lo, up = lo[active], up[active]
+        index = [k for k, a in zip(index, active) if a]
+    return rows, cols, coefs, lo, up, index
@@ -7,6 +7,7 @@ from pyomo.environ import Var as add_var
 from pyomo.environ import Param as add_params
 from pyomo.environ import Set as add_set
 from functools import wraps
+from contextlib import nullcontext
 import time
 
 
@@ -34,14 +35,23 @@ def Set(*args, **kwargs):
 
 
 def timeit(method):
-    """Get timing by decorator."""
+    """Get timing by decorator, the call is also recorded as a phase of the\
+    profiler of the model (see profile)."""
     @wraps(method)
     def timed(*args, **kwargs):
         ts = time.time()
-        result = method(*args, **kwargs)
+        with profile(args[0], method.__name__):
+            result = method(*args, **kwargs)
         te = time.time()
         if hasattr(args[0], 'log'):
             if args[0].time == True:
                 args[0].log.info(f'{method.__name__} took {te-ts} s.')
         return result
     return timed
+
+
+def profile(model, name):
+    """Phase of the profiler of a CapsuleModel (a profiling.Profiler), nothing is
+    recorded if it has none."""
+    profiler = getattr(model, 'profiler', None)
+    return nullcontext() if profiler is None else profiler.phase(name)
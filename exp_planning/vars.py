@@ -12,8 +12,8 @@ def create_vars(CapsuleModel, data):
     m.zeta = Var(m.T, m.D)
     m.l_tds = Var(m.T, m.D, m.S,  domain=NonNegativeReals)
 
-    m.l_cje = Var(m.CJE, domain=NonNegativeReals)
-    m.soc_aux = Var(m.CJEH, domain=NonNegativeReals)
+    m.l_ci = Var(m.CI, domain=NonNegativeReals)
+    m.soc_aux = Var(m.CIH, domain=NonNegativeReals)
     m.soc_ref = Var(m.H, domain=NonNegativeReals)
 
     # investment variables
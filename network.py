@@ -1,8 +1,84 @@
 import pandas as pd
-from itertools import product
+import numpy as np
 import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.lines import Line2D
+from profiling import profiled
+
+
+def expand_profile(p, label):
+    """Profiles by day (columns day, t0..t23) as a long table with columns T, label, D,
+    ordered by day and hour."""
+    hours = p.drop('day', axis=1)
+    n_days, n_hours = hours.shape
+    return pd.DataFrame({
+        'T': np.tile([int(s[1:]) for s in hours.columns], n_days),
+        label: hours.to_numpy().ravel(),
+        'D': np.repeat(p['day'].to_numpy(), n_hours)})
+
+
+def cross_join(df, column, values):
+    """Repeat df for every value, stored in a new column."""
+    out = pd.DataFrame({c: np.tile(df[c].to_numpy(), len(values)) for c in df.columns})
+    out[column] = np.repeat(np.asarray(values), len(df))
+    return out
+
+
+def parse_id_lists(column):
+    """Comma separated ids of every row of column (e.g. "10,2") as arrays of
+    row positions and ids. Empty cells have no ids."""
+    ids = pd.Series(column.to_numpy(), dtype=object).dropna().astype(str).str.split(',').explode()
+    ids = ids.str.strip()
+    ids = ids[ids != '']
+    return ids.index.to_numpy(dtype=np.int64), ids.astype(float).astype(np.int64).to_numpy()
+
+
+class GridStates:
+    """Grid states as the base topology plus the positions of the branches out of
+    service in every state, instead of a full topology column per state.
+
+    Selecting a single state returns its dense topology column, so the object can
+    be used as the grid_states DataFrame; to_dense returns that DataFrame.
+
+    Arguments:
+        base (pd.Series): Base topology of every branch.
+        outages (dict): Positions of the branches out of service, by state.
+    """
+
+    def __init__(self, base, outages):
+        self.base = base
+        self.outages = outages
+
+    def keys(self):
+        return list(self.outages.keys())
+
+    @property
+    def columns(self):
+        return pd.Index(self.keys())
+
+    def __len__(self):
+        return len(self.outages)
+
+    def __iter__(self):
+        return iter(self.outages)
+
+    def __contains__(self, state):
+        return state in self.outages
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple, pd.Index, np.ndarray)):
+            return GridStates(self.base, {k: self.outages[k] for k in key})
+        topology = self.base.copy().rename(key)
+        topology.iloc[self.outages[key]] = 0
+        return topology
+
+    def outage(self, state):
+        return self.outages[state]
+
+    def to_dense(self):
+        """States as a DataFrame with the topology of every state as a column."""
+        values = np.repeat(self.base.to_numpy()[:, None], len(self), axis=1)
+        for n, out in enumerate(self.outages.values()):
+            values[out, n] = 0
+        return pd.DataFrame(values, index=self.base.index, columns=self.columns)
 
 
 class Network:
@@ -37,6 +113,31 @@ class Network:
         # reliability and resilience variables
         self.failure_events, self.extreme_failures, self.event_list = {}, {}, {}
 
+    @property
+    def branches(self):
+        return self._branches
+
+    @branches.setter
+    def branches(self, branches):
+        # the bus index is built again every time the branch table is replaced
+        self._branches = branches
+        self._index_branches()
+
+    def _index_branches(self):
+        """Index of the branches connected to every bus, in branch table order."""
+        br = self._branches
+        pos = np.arange(len(br))
+        incidence = pd.DataFrame({
+            'bus': np.concatenate([br.from_bus.to_numpy(), br.to_bus.to_numpy()]),
+            'pos': np.concatenate([pos, pos])}).drop_duplicates().sort_values('pos', kind='stable')
+        labels = br.index.to_numpy()
+        self.bus_branches = {bus: labels[p].tolist() for bus, p in incidence.groupby('bus').pos}
+
+    def substation_branches(self, substations):
+        """Branches connected to the buses of the given substations."""
+        buses = self.substations.loc[substations, 'bus']
+        return [l for bus in buses for l in self.bus_branches.get(bus, [])]
+
     def add_hourly_profiles(self, hp):
 
         prof = hp['profiles']
@@ -83,59 +184,68 @@ class Network:
             sbs = self.substations['bus'].reset_index()
             sbs['substation_index'] = 'S_R_' + sbs['substation_index'].astype(str)
             sbs[['frequency', 'duration']] = rf['substations']
-            sbs['branches'] = sbs['bus'].apply(lambda bus: br.loc[
-                (br.from_bus == bus) | (br.to_bus == bus)].index.to_list())
+            sbs['branches'] = [list(self.bus_branches.get(bus, [])) for bus in sbs['bus']]
             sbs['routine'] = 1
             self.failure_events.update(
                 sbs.drop('bus', axis=1).set_index('substation_index').T.to_dict())
 
     def add_event_list(self, event_list, rewrite=True):
+        """Add the events of a list_of_events table, whose branches and substations
+        columns are comma separated ids. Substations are replaced by their branches
+        and events with the same branches out share the same list."""
         if rewrite:
             self.event_list = {}
 
-        for k in ['branches', 'substations']:
-            event_list[k] = event_list[k].fillna(-1).apply(
-                lambda x: [] if x == -1 else [int(float(s)) for s in str(x).split(',')])
-        event_list['routine'] = 1
-        event_list['event'] = event_list.index.to_series().apply(lambda x: 'EVT_' + str(x))
-
-        events =event_list.set_index('event').T.to_dict()
-
-        br = self.branches
-        for n, n_ev in enumerate(events.keys()):
-            ev = events[n_ev]
-            # converting substations to branches
-            sbs = self.substations.loc[ev['substations']]
-            lines = sbs['bus'].apply(lambda bus: br.loc[
-                (br.from_bus == bus) | (br.to_bus == bus)].index.to_list()).to_list()
-            branches = [l for sl in lines for l in sl] + ev['branches']
-
-            # updating event and adding to the list
-            ev['branches'] = list(set(branches))
-            ev.pop('substations')
-
-            self.event_list.update({n_ev: ev})
+        # (row, branch) pairs of the branches and of the substations of every event
+        rows, branches = parse_id_lists(event_list['branches'])
+        sb_rows, sbs = parse_id_lists(event_list['substations'])
+        sb_bus = self.substations['bus'].reindex(sbs)
+        if sb_bus.isna().any():
+            raise KeyError(f'Substations {sorted(set(sbs[sb_bus.isna().to_numpy()]))} not found')
+        sb_branches = [self.bus_branches.get(bus, []) for bus in sb_bus]
+        rows = np.concatenate([rows, np.repeat(sb_rows, [len(b) for b in sb_branches])])
+        branches = np.concatenate([branches, [l for b in sb_branches for l in b]]).astype(np.int64)
+
+        # sorted unique branches of every event, identical outage sets are interned
+        order = np.lexsort((branches, rows))
+        rows, branches = rows[order], branches[order]
+        keep = np.ones(len(rows), dtype=bool)
+        keep[1:] = (rows[1:] != rows[:-1]) | (branches[1:] != branches[:-1])
+        bounds = np.cumsum(np.bincount(rows[keep], minlength=len(event_list))).tolist()
+        branches = branches[keep].tolist()
+        interned = {}
+        outages = [interned.setdefault(key, list(key)) for key in
+                   (tuple(branches[a:b]) for a, b in zip([0] + bounds[:-1], bounds))]
+
+        events = event_list.drop(['branches', 'substations'], axis=1)
+        events['routine'] = 1
+        columns = list(events.columns)
+        for name, values, out in zip('EVT_' + event_list.index.astype(str),
+                                     zip(*(events[c].tolist() for c in columns)), outages):
+            ev = dict(zip(columns, values))
+            ev['branches'] = out
+            self.event_list[name] = ev
 
     def add_extreme_events(self, extreme_events, rewrite=True):
 
         if rewrite:
             self.extreme_failures = {}
 
-        br = self.branches
         for n, ev in enumerate(extreme_events):
             # converting substations to branches
-            sbs = self.substations.loc[ev['substations']]
-            lines = sbs['bus'].apply(lambda bus: br.loc[
-                (br.from_bus == bus) | (br.to_bus == bus)].index.to_list()).to_list()
-            branches = [l for sl in lines for l in sl] + ev['branches']
+            branches = self.substation_branches(ev['substations']) + ev['branches']
 
             # updating event and adding to the list
-            ev['branches'] = list(set(branches))
+            ev['branches'] = sorted(set(branches))
             ev.pop('substations')
             ev.update({'routine': 0})
             self.extreme_failures.update({f'HILP_{n}': ev})
 
-    def get_data(self):
+    @profiled
+    def get_data(self, share_bat_prof=False):
+        """Get the tables of the network in the REPAIR format. Use share_bat_prof
+        to get a single battery profile (without H column) for all storage units.
+        f_load is a (T, D, S) array over the hours, the days of demand_prof and the scenarios."""
 
         # update failures list and get states and scenarios
         if len(self.event_list) > 0:
@@ -156,39 +266,19 @@ class Network:
         bus_tb = buses.set_index('bus').sort_index()
 
         # expand profiles
-        def expand_profile(p, label):
-            p = p.set_index('day').T.reset_index().rename(columns={'index': 'T'})
-            p['T'] = p['T'].apply(lambda s: int(s[1:]))
-            p = p.set_index('T')
-            p_ext = pd.DataFrame()
-            for d in p.keys():
-                df = pd.DataFrame(p[d].rename(label))
-                df['D'] = d
-                p_ext = pd.concat([p_ext, df])
-            return p_ext.reset_index()
-        # expand storage
+        # expand storage, a single profile shared by all units if share_bat_prof
         bat_p = expand_profile(self.hourly_profiles['battery_soc'], 'f_bat')
-        bat_prof = pd.DataFrame()
-        for h in self.candidate_storage.bus.unique():
-            bat_p['H'] = h
-            bat_prof = pd.concat([bat_prof, bat_p])
+        if share_bat_prof:
+            bat_prof = bat_p
+        else:
+            bat_prof = cross_join(bat_p, 'H', self.candidate_storage.bus.unique())
         # expand substation_costs
-        sub_c = expand_profile(self.hourly_profiles['costs_dol_kWh'], 'c_tr_kwh')
-        sub_cost = pd.DataFrame()
-        for s in self.substations.bus.unique():
-            sub_c['substation'] = s
-            sub_cost = pd.concat([sub_cost, sub_c])
-        # expand demand profile
-        demand_prof = self.hourly_profiles['demand_profile']
-        dp = expand_profile(self.hourly_profiles['demand_profile'], 'load_factor')
-
-        # scenarios time
-        scenarios_time = pd.merge(
-            pd.DataFrame(product(demand_prof.day.to_numpy(), list(range(24)),
-                                 scenarios['state']),
-                         columns=['d', 't', 'state']), scenarios.reset_index(), on='state')
-
-        scenarios_time = scenarios_time.merge(dp.rename(columns={'T': 't', 'D': 'd'}))
+        sub_cost = cross_join(expand_profile(self.hourly_profiles['costs_dol_kWh'], 'c_tr_kwh'),
+                              'substation', self.substations.bus.unique())
+        # demand profile, the load factor of every scenario is the one of its day and hour
+        demand_prof = self.hourly_profiles['demand_profile'].set_index('day')
+        load = demand_prof.to_numpy(dtype=float).T
+        f_load = np.broadcast_to(load[:, :, None], load.shape + (len(scenarios),))
 
         data = {'substations': self.substations.set_index('bus'),
                 'lines': self.all_branches.rename(columns={'from_bus': 'from', 'to_bus': 'to',
@@ -196,42 +286,44 @@ class Network:
                 'grid_states': grid_states,
                 'scenarios': scenarios,
                 'bus_tb': bus_tb,
-                'demand_prof': demand_prof.drop('day', axis=1),
+                'demand_prof': demand_prof,
                 'bat_prof': bat_prof,
-                'substations_cost': sub_cost.reset_index()[['substation', 'T', 'D', 'c_tr_kwh']],
+                'substations_cost': sub_cost[['substation', 'T', 'D', 'c_tr_kwh']],
                 'days': self.weight_days,
-                'scenarios_time': scenarios_time,
+                'f_load': f_load,
                 'storage': self.candidate_storage.set_index('bus')
                 }
 
         return data
 
+    @profiled
     def _state_scenarios(self):
         """
         Transforms the grid failures into the grid_states
         scenarios of the REPAIR format
         """
         br = self.all_branches
-        grid_states = pd.DataFrame()
-        grid_states['state_0'] = br['base_topology']
 
         # unique states:
-        fe = pd.DataFrame(self.failure_events).T
+        fe = pd.DataFrame.from_dict(self.failure_events, orient='index')
 
-        fe['state'] = fe['branches'].apply(lambda x: tuple(x))
+        # events with the same branches out, in any order, are the same state
+        fe['state'] = [tuple(sorted(set(x))) for x in fe['branches']]
         f_st = pd.DataFrame(fe['state'].unique(), columns=['lines_out']).reset_index()
         f_st['index'] = 'state_' + (f_st['index']+1).astype('str')
         map_states = f_st.set_index('lines_out')['index'].to_dict()
         # for some reason the next does not work with .map
         fe['state'] = [map_states[x] for x in fe['state']]
 
-        def top(ln_out):
-            """gets a list of lines out and returns the base topology vector"""
-            top_state = br['base_topology'].copy()
-            top_state.loc[ln_out] = 0
-            return top_state
-
-        grid_states[f_st['index']] = f_st.lines_out.apply(top).T
+        # every state keeps the positions of its branches out of service
+        position = dict(zip(br.index, range(len(br))))
+        outages = {'state_0': np.array([], dtype=np.int64)}
+        for state, ln_out in zip(f_st['index'], f_st.lines_out):
+            missing = [b for b in ln_out if b not in position]
+            if missing:
+                raise KeyError(f'Branches {missing} of {state} are not in the network')
+            outages[state] = np.unique(np.array([position[b] for b in ln_out], dtype=np.int64))
+        grid_states = GridStates(br['base_topology'], outages)
 
         fe['probability'] = fe.frequency / 8760.0
 
@@ -253,6 +345,10 @@ class Network:
         self.all_branches = all_branches
 
     def visualize(self):
+        # matplotlib is only needed here, and slow to import
+        import matplotlib.pyplot as plt
+        from matplotlib.lines import Line2D
+
         branches = self.branches.copy()
         substations = self.substations[['bus']].copy()
         substations['is_substation'] = 1
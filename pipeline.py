@@ -0,0 +1,285 @@
+"""
+Staged run of the investment model.
+
+Every subcommand runs one stage and keeps its artifact in a work folder:
+
+    preprocess  case folder or bundle -> data.pkl, the preprocessed case
+    build       data.pkl -> model.lp or model.mps, to inspect or for other solvers
+    solve       data.pkl -> solution.pkl, objective terms, solve outcome and tables
+    export      solution.pkl -> result files (csv, parquet or feather) and store
+
+build is not a step of solve: a Pyomo model can not be restored from its LP
+file, and get_solutions needs the model, so solve builds it again in memory from
+data.pkl. Neither solve nor export runs build or reads its artifact.
+
+A stage first brings the stages it reads from up to date, and is skipped when
+the hash of its inputs (case files, general parameters, the artifact it reads
+and its own options) is the one recorded with its artifact in stages.json, so a
+crash or a new option only redoes the stages it affects. Options that are not
+given, the case included, keep their value of the last run of the stage. Pyomo is only imported
+by build and solve (networkx, through data.py, by the stages that check the
+case files, and pandas by the stages that read or write tables), so preprocessing
+and exporting start fast. Run from the main folder:
+
+    python pipeline.py solve --case example_case --solver appsi_highs
+    python pipeline.py export --format parquet --store results.sqlite
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import custom_logger
+from cache import DataCache
+from profiling import Profiler, phase, active_profiler
+from utils import save_object, load_object
+
+logger = logging.getLogger("MAIN")
+
+# options of every stage that are part of the hash of its inputs
+STAGE_OPTIONS = {
+    'preprocess': ['case'],
+    'build': ['matrix', 'model_format'],
+    'solve': ['matrix', 'solver', 'threads', 'mip_gap', 'time_limit', 'presolve'],
+    'export': ['format', 'folder', 'store', 'store_operational'],
+}
+
+
+class Pipeline:
+    """Stages of a run of a case, with their artifacts in a work folder.
+
+    Arguments:
+        case (str): Case folder or bundle, that of the last preprocess stage\
+        of the work folder if None.
+        work (str): Folder of the artifacts and of stages.json, created if needed.
+        cache (str): DataCache folder of the preprocessed data, shared between\
+        work folders.
+        force (list): Stages run again even if their inputs did not change.
+        options: Options of the stages, see STAGE_OPTIONS.
+    """
+
+    def __init__(self, case=None, work='work', cache='.cache', force=(), **options):
+        self.work = work
+        self.cache = cache
+        self.force = set(force)
+        self.options = {**options, 'case': case}
+        self._data = None
+        os.makedirs(work, exist_ok=True)
+        self.stages = {}
+        if os.path.exists(self.path('stages.json')):
+            with open(self.path('stages.json')) as f:
+                self.stages = json.load(f)
+        self.case = self.stage_options('preprocess')['case']
+        if self.case is None:
+            raise ValueError(f'No case was preprocessed in {work}, give a case folder or bundle (--case)')
+        if options.get('format') is not None:
+            # checked before any stage runs, not after the solve
+            from writers import WRITERS
+            if options['format'] not in WRITERS:
+                raise ValueError(f"Unknown result format {options['format']}, use one of "
+                                 f"{', '.join(WRITERS)}")
+
+    def path(self, artifact):
+        """Path of an artifact, relative to the work folder unless absolute."""
+        return os.path.join(self.work, artifact)
+
+    def stage_options(self, stage):
+        """Options of a stage, those not given are the ones of its last run."""
+        last = self.stages.get(stage, {}).get('options', {})
+        return {k: last.get(k) if self.options.get(k) is None else self.options[k]
+                for k in STAGE_OPTIONS[stage]}
+
+    def key(self, stage, *inputs):
+        """Hash of the inputs and options of a stage."""
+        return DataCache.key(stage=stage, inputs=inputs, options=self.stage_options(stage))
+
+    def fresh(self, stage, key):
+        """True if the artifacts of a stage were made from the same inputs."""
+        record = self.stages.get(stage)
+        if stage in self.force or record is None or record['key'] != key:
+            return False
+        return all(os.path.exists(self.path(a)) for a in record['artifacts'])
+
+    def done(self, stage, key, artifacts, start):
+        self.stages[stage] = {'key': key, 'artifacts': artifacts,
+                              'options': self.stage_options(stage),
+                              'created': datetime.now().isoformat(timespec='seconds'),
+                              'wall': time.perf_counter() - start}
+        # the record is replaced at once, a crash leaves the previous one
+        with open(self.path('stages.json.tmp'), 'w') as f:
+            json.dump(self.stages, f, indent=1)
+        os.replace(self.path('stages.json.tmp'), self.path('stages.json'))
+        logger.info(f"Stage {stage} done in {self.stages[stage]['wall']:.1f} s")
+
+    def save(self, obj, artifact):
+        save_object(obj, self.path(artifact) + '.tmp')
+        os.replace(self.path(artifact) + '.tmp', self.path(artifact))
+
+    def data(self):
+        """Preprocessed case of the last preprocess stage."""
+        if self._data is None:
+            self._data = load_object(self.path('data.pkl'))
+        return self._data
+
+    def preprocess(self):
+        """Preprocessed case, reloaded from the DataCache when only the general
+        parameters changed. Returns the key of the stage."""
+        from data import case_key, read_parameters, read_data_alternative
+        key = self.key('preprocess', case_key(self.case), read_parameters(self.case))
+        if self.fresh('preprocess', key):
+            logger.info(f'Stage preprocess is up to date in {self.work}')
+            return key
+        start = time.perf_counter()
+        with phase('preprocess'):
+            self._data = read_data_alternative(self.case, cache=DataCache(self.cache),
+                                               workers=self.options.get('workers') or 1)
+            self.save(self._data, 'data.pkl')
+        self.done('preprocess', key, ['data.pkl'], start)
+        return key
+
+    def build(self):
+        """Model file (LP or MPS, with the Pyomo names of the variables and
+        constraints). Returns the key of the stage."""
+        key = self.key('build', self.preprocess())
+        options = self.stage_options('build')
+        artifact = f"model.{options['model_format'] or 'lp'}"
+        if self.fresh('build', key):
+            logger.info(f'Stage build is up to date in {self.work}')
+            return key
+        from run import investment_model
+        start = time.perf_counter()
+        with phase('build'):
+            opt = investment_model(self.data(), active_profiler(), bool(options['matrix']))
+            opt.model.write(self.path(artifact) + '.tmp', format=artifact.split('.')[1],
+                            io_options={'symbolic_solver_labels': True})
+            os.replace(self.path(artifact) + '.tmp', self.path(artifact))
+        self.done('build', key, [artifact], start)
+        return key
+
+    def solve(self):
+        """Solution of the model: objective terms, solve outcome and every
+        result table. The model is built again from data.pkl, the artifact of
+        build is not used (a Pyomo model is not restored from its LP file).
+        Returns the key of the stage."""
+        key = self.key('solve', self.preprocess())
+        if self.fresh('solve', key):
+            logger.info(f'Stage solve is up to date in {self.work}')
+            return key
+        from run import investment_model, objective_terms
+        options = self.stage_options('solve')
+        start = time.perf_counter()
+        with phase('solve'):
+            data = self.data()
+            opt = investment_model(data, active_profiler(), bool(options.pop('matrix')))
+            res = opt.solve(options.pop('solver'), tee=False, **options)
+            if res.objective is None:
+                raise RuntimeError(f"No solution found: {res}")
+            solve = {k: getattr(res, k) for k in
+                     ['solver', 'status', 'objective', 'bound', 'gap', 'nodes', 'wall_time']}
+            self.save({'obj': objective_terms(opt), 'solve': solve,
+                       'tables': opt.get_solutions(data), 'parameters': data.parameters,
+                       'input_hash': data.input_hash, 'case': self.case}, 'solution.pkl')
+        self.done('solve', key, ['solution.pkl'], start)
+        return key
+
+    def export(self):
+        """Result files of the solution, and a run in the SQLite store when
+        given. Returns the key of the stage."""
+        key = self.key('export', self.solve())
+        if self.fresh('export', key):
+            logger.info(f'Stage export is up to date in {self.work}')
+            return key
+        import pandas as pd
+        from writers import result_writer
+        from store import ResultStore, INVESTMENT_TABLES
+        options = self.stage_options('export')
+        folder = options['folder'] or 'solutions'
+        start = time.perf_counter()
+        with phase('export'):
+            solution = load_object(self.path('solution.pkl'))
+            tables = {'obj_inv': pd.DataFrame(solution['obj'], index=[0])}
+            tables.update((t, f) for t, f in solution['tables'].items() if f is not None)
+            with result_writer(options['format'] or 'csv', folder) as writer:
+                for table, frame in tables.items():
+                    writer.write(table, frame)
+                # the outputs are outside of the work folder
+                artifacts = [os.path.abspath(writer.path(t)) for t in tables]
+            logger.info(f"Solutions written to {folder}")
+            if options['store']:
+                tables = solution['tables'] if options['store_operational'] else \
+                    {t: solution['tables'].get(t) for t in INVESTMENT_TABLES}
+                with ResultStore(options['store']) as store:
+                    run_id = store.add_run(solution['obj'], tables, solution['parameters'],
+                                           solution['input_hash'], solution['case'],
+                                           SimpleNamespace(**solution['solve']))
+                logger.info(f"Run {run_id} added to {options['store']}")
+                artifacts.append(os.path.abspath(options['store']))
+        self.done('export', key, artifacts, start)
+        return key
+
+
+def parse_args():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--case", default=None,
+                        help="case folder or bundle, the last one of the work folder by default")
+    common.add_argument("--work", default="work", help="folder of the artifacts of the stages")
+    common.add_argument("--cache", default=".cache", help="cache of the preprocessed data")
+    common.add_argument("--force", action="store_true",
+                        help="run the stage again even if its inputs did not change")
+    common.add_argument("--workers", type=int, default=1, help="workers of states_evaluation")
+    model = argparse.ArgumentParser(add_help=False)
+    model.add_argument("--matrix", action="store_true", default=None,
+                       help="build the operational constraints in matrix form")
+    model.add_argument("--no-matrix", dest="matrix", action="store_false",
+                       help="build every constraint as a Pyomo constraint (default)")
+    solve = argparse.ArgumentParser(add_help=False)
+    solve.add_argument("--solver", nargs="+", default=None)
+    solve.add_argument("--threads", type=int, default=None)
+    solve.add_argument("--mip-gap", type=float, default=None, help="relative MIP gap")
+    solve.add_argument("--time-limit", type=float, default=None, help="seconds")
+    solve.add_argument("--presolve", type=int, choices=[0, 1, 2], default=None)
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    stages = parser.add_subparsers(dest="stage", required=True)
+    stages.add_parser("preprocess", parents=[common], help="preprocess the case")
+    build = stages.add_parser("build", parents=[common, model], help="write the model file")
+    build.add_argument("--model-format", choices=["lp", "mps"], default=None, help="lp by default")
+    stages.add_parser("solve", parents=[common, model, solve], help="solve the model")
+    export = stages.add_parser("export", parents=[common, model, solve],
+                               help="write the result files")
+    export.add_argument("--format", default=None,
+                        help="format of the result files: csv (default), parquet or feather, "
+                             "parquet and feather require pyarrow")
+    export.add_argument("--folder", default=None, help="folder of the result files, solutions "
+                                                       "by default")
+    export.add_argument("--store", default=None,
+                        help="SQLite file where the objective and investments of the run are "
+                             "added, '' for none")
+    export.add_argument("--store-operational", action="store_true", default=None,
+                        help="also add the operational tables to the store")
+    export.add_argument("--no-store-operational", dest="store_operational", action="store_false",
+                        help="add only the objective and investments to the store (default)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args.work, exist_ok=True)
+    custom_logger.init_logger(filename=os.path.join(args.work, "pipeline.log"))
+    options = {k: v for k, v in vars(args).items()
+               if k not in ('stage', 'case', 'work', 'cache', 'force')}
+    try:
+        pipeline = Pipeline(args.case, args.work, args.cache,
+                            force=[args.stage] if args.force else [], **options)
+    except ValueError as e:
+        sys.exit(f'pipeline.py: error: {e}')
+    with Profiler(os.path.join(args.work, f"{args.stage}_phases.jsonl"), case=pipeline.case):
+        getattr(pipeline, args.stage)()
+
+
+if __name__ == '__main__':
+    main()
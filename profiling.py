@@ -0,0 +1,185 @@
+"""
+Phase profiling of a run.
+
+A Profiler records, for every phase of a run (reading the case, building the
+network, evaluating the states, every build step, the solve...), its wall and
+CPU time, the peak resident memory of the process and, when enabled, the peak
+of the Python allocations traced by tracemalloc and the number of live
+objects. The records are kept in memory and appended as JSON lines to a file
+as each phase ends, tagged with the id of the run so the file keeps the
+history of the runs.
+
+Functions decorated with profiled, and the phase context manager, record on
+the active profiler (the one of the innermost `with Profiler(...)` block) and
+do nothing when there is none:
+
+    with Profiler('run_phases.jsonl') as prof:
+        data = read_data_alternative('example_case')
+    prof.to_frame()
+"""
+import gc
+import json
+import logging
+import sys
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("MAIN")
+
+_active = []
+
+# new in Python 3.9, before that the peaks are those since tracing started
+_reset_peak = getattr(tracemalloc, 'reset_peak', lambda: None)
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MB, None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB elsewhere
+    return peak / 2 ** (20 if sys.platform == 'darwin' else 10)
+
+
+class Profiler:
+    """Records of the phases of a run.
+
+    Arguments:
+        filename (str): Optional JSON lines file, one line per phase is\
+        appended as it ends.
+        trace (bool): True for tracing Python allocations with tracemalloc,\
+        which slows the run down.
+        objects (bool): True for counting the live objects (gc.get_objects)\
+        at the start and end of every phase.
+        info: Added to every record (e.g. case=folder).
+    Attributes:
+        run_id (str): Id of the run, in every record as run_id.
+        records (list): One dictionary per phase, in the order the phases\
+        end: phase, parent, depth, start (s since the profiler was created),\
+        wall and cpu (s), peak_rss_mb, rss_growth_mb (growth of the peak\
+        during the phase), peak_traced_mb, objects and new_objects (when\
+        enabled), failed, run_id and info.
+    """
+
+    def __init__(self, filename=None, trace=False, objects=False, **info):
+        self.filename = filename
+        self.trace = trace
+        self.objects = objects
+        self.info = info
+        self.run_id = uuid.uuid4().hex
+        self.records = []
+        self._stack = []
+        self._file = None
+        self._tracing = False
+        self._t0 = time.perf_counter()
+
+    def __enter__(self):
+        if self.filename is not None:
+            self._file = open(self.filename, 'a')
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        _active.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        _active.remove(self)
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        return False
+
+    @contextmanager
+    def phase(self, name, **info):
+        """Record the block as a phase, nested phases keep it as parent."""
+        parent = self._stack[-1] if self._stack else None
+        trace = self.trace and tracemalloc.is_tracing()
+        if trace:
+            # the peak so far belongs to the parent, the phase starts a new one
+            if parent is not None:
+                parent['peak'] = max(parent['peak'], tracemalloc.get_traced_memory()[1])
+            _reset_peak()
+        frame = {'name': name, 'peak': 0}
+        self._stack.append(frame)
+        objects = len(gc.get_objects()) if self.objects else None
+        rss = peak_rss_mb()
+        start, cpu = time.perf_counter(), time.process_time()
+        failed = False
+        try:
+            yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+            self._stack.pop()
+            record = {'phase': name, 'parent': parent and parent['name'],
+                      'depth': len(self._stack), 'start': start - self._t0,
+                      'wall': wall, 'cpu': cpu, 'peak_rss_mb': peak_rss_mb()}
+            record['rss_growth_mb'] = None if rss is None else record['peak_rss_mb'] - rss
+            if trace:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_traced_mb'] = peak / 2 ** 20
+                if parent is not None:
+                    parent['peak'] = max(parent['peak'], peak)
+                _reset_peak()
+            if objects is not None:
+                record['objects'] = len(gc.get_objects())
+                record['new_objects'] = record['objects'] - objects
+            record['failed'] = failed
+            record['run_id'] = self.run_id
+            record.update(self.info)
+            record.update(info)
+            self._add(record)
+
+    def _add(self, record):
+        self.records.append(record)
+        if self._file is not None:
+            self._file.write(json.dumps(record, default=str) + '\n')
+            self._file.flush()
+        rss = record['peak_rss_mb']
+        logger.debug(f"Phase {record['phase']}: {record['wall']:.3f} s wall, "
+                     f"{record['cpu']:.3f} s CPU" + ('' if rss is None else f", peak RSS {rss:.0f} MB"))
+
+    def to_frame(self):
+        """Records as a DataFrame, one row per phase."""
+        import pandas as pd
+        return pd.DataFrame(self.records)
+
+
+def active_profiler():
+    """Profiler of the innermost `with Profiler(...)` block, None outside of them."""
+    return _active[-1] if _active else None
+
+
+@contextmanager
+def phase(name, **info):
+    """Record the block as a phase of the active profiler, if there is one."""
+    if not _active:
+        yield
+    else:
+        with _active[-1].phase(name, **info):
+            yield
+
+
+def profiled(func):
+    """Decorator recording every call of a function as a phase of the active
+    profiler, named after the function."""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return func(*args, **kwargs)
+        with _active[-1].phase(func.__name__.lstrip('_')):
+            return func(*args, **kwargs)
+    return wrapper
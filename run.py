@@ -1,45 +1,129 @@
+import argparse
 import traceback
 import logging
 import custom_logger
 import pandas as pd
+from pyomo.environ import value
 
 from exp_planning import CapsuleModel as ExpansionPlanning
+from exp_planning.model import SOLUTION_TABLES
 from data import read_data_alternative
+from cache import DataCache
+from profiling import Profiler, active_profiler
+from writers import WRITERS, result_writer
+from store import ResultStore, INVESTMENT_TABLES
 
 # Initialize logger
 logger = logging.getLogger("MAIN")
-custom_logger.init_logger(filename="run_investment.log")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the REPAIR investment model.")
+    parser.add_argument("--case", default="example_case",
+                        help="case folder, or bundle file written by bundle.py")
+    parser.add_argument("--solver", nargs="+", default=None,
+                        help="solvers to try in order (cplex, gurobi, highs, cbc, glpk), "
+                             "the first installed one is used by default")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--mip-gap", type=float, default=None, help="relative MIP gap")
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds")
+    parser.add_argument("--presolve", type=int, choices=[0, 1, 2], default=None,
+                        help="0 off, 1 solver default, 2 aggressive")
+    parser.add_argument("--format", choices=list(WRITERS), default="csv",
+                        help="format of the result files, parquet and feather require pyarrow")
+    parser.add_argument("--store", default=None,
+                        help="SQLite file where the objective and investments of the run are added")
+    parser.add_argument("--store-operational", action="store_true",
+                        help="also add the operational tables to the store")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record the peak of Python allocations of every phase (slower)")
+    parser.add_argument("--count-objects", action="store_true",
+                        help="record the number of live objects after every phase")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+    custom_logger.init_logger(filename="run_investment.log")
     logger.info("Program initialized")
-    input_folder = "example_case"
+    input_folder = args.case
 
-    data = read_data_alternative(input_folder)
+    # phase times and memory, as JSON lines next to run_investment.log
+    with Profiler("run_investment_phases.jsonl", trace=args.trace_memory,
+                  objects=args.count_objects, case=input_folder):
+        data = read_data_alternative(input_folder, cache=DataCache('.cache'))
 
-    logger.info(f"Data folder {input_folder} read, building optimization model")
-    run_investment(data, folder="solutions")
+        logger.info(f"Data folder {input_folder} read, building optimization model")
+        run_investment(data, solver=args.solver, threads=args.threads, mip_gap=args.mip_gap,
+                       time_limit=args.time_limit, presolve=args.presolve, folder="solutions",
+                       output_format=args.format, store=args.store,
+                       store_operational=args.store_operational, case=input_folder)
 
 
-def run_investment(data, **kwargs):
-    opt = ExpansionPlanning()
-    opt.model.FIX_V_SLACK = False
-    opt.build_model(data)
+def run_investment(data, solver=None, threads=None, mip_gap=None, time_limit=None,
+                   presolve=None, profiler=None, output_format='csv', store=None,
+                   store_operational=False, **kwargs):
+    # phases are recorded on the given or active profiler, or on a new one
+    if profiler is None:
+        profiler = active_profiler() or Profiler()
+    opt = investment_model(data, profiler)
 
     logger.info("Solving Optimization model")
-    res = opt.solve('cplex', tee=True)
+    res = opt.solve(solver, tee=True, threads=threads, mip_gap=mip_gap,
+                    time_limit=time_limit, presolve=presolve)
+    if res.objective is None:
+        raise RuntimeError(f"No solution found: {res}")
+
+    obj = objective_terms(opt)
+    logger.info("Printing objective costs:")
+    for i, j in obj.items():
+        logger.info(f"{i}: {j}")
+
+    results = opt.get_solutions(data, ['line_inv', 'storage_inv'])
+    data.lines_inv = results['line_inv']
+    if not data.storage.empty:
+        data.storage_inv = results['storage_inv']
+
+    if 'folder' in kwargs:
+        folder = kwargs['folder']
+        # tables are written as they are read, by day for columnar formats
+        with profiler.phase('write_solutions'), result_writer(output_format, folder) as writer:
+            writer.write('obj_inv', pd.DataFrame(obj, index=[0]))
+            logger.info(f"Writing solutions to {folder}")
+            for table, chunk in opt.iter_solutions(data, by_day=writer.chunked):
+                writer.write(table, chunk)
+
+    run_id = None
+    if store is not None:
+        with profiler.phase('store_results'):
+            run_id = store_run(opt, data, obj, res, store, store_operational, kwargs.get('case'))
+
+    return{'obj': obj, 'storage_inv': results.get('storage_inv'), 'line_inv': results['line_inv'],
+           'phases': profiler.records, 'run_id': run_id}
 
+
+def investment_model(data, profiler=None, matrix=False):
+    """Investment model of a preprocessed case, built and ready to solve."""
+    opt = ExpansionPlanning(profiler=profiler)
+    opt.model.FIX_V_SLACK = False
+    opt.build_model(data, matrix)
+    return opt
+
+
+def objective_terms(opt):
+    """Terms of the objective of a solved model, with the costs of the CVaR and
+    of load shedding in islands."""
     m = opt.model
 
     def load_shedding_island_costs(m):
-        return m.pf * m.c_imb * sum(
+        return value(m.pf * m.c_imb) * sum(
             m.w[d] * sum(m.s_prob[s] * m.l_tds[t, d, s].value for t in m.T for s in m.S)
             for d in m.D)
 
     def cvar_costs(m):
-        return m.pf * m.c_imb * sum(m.w[d] * sum(
+        return value(m.pf * m.c_imb) * sum(m.w[d] * sum(
                 m.zeta[t, d].value + sum(
-                    m.s_prob[s] / (1-m.alpha_cvar) * m.phi_cvar[t,d,s].value
+                    m.s_prob[s] / (1-value(m.alpha_cvar)) * m.phi_cvar[t,d,s].value
                     for s in m.S)
                 for t in m.T)
             for d in m.D)
@@ -47,24 +131,26 @@ def run_investment(data, **kwargs):
     obj = opt.get_objective_solution()
     obj['cvar_costs'] = cvar_costs(m)
     obj['load_shedding_island_costs'] = load_shedding_island_costs(m)
+    return obj
 
-    logger.info("Printing objective costs:")
-    for i, j in obj.items():
-        logger.info(f"{i}: {j}")
 
-    results = opt.get_solutions(data)
-    data.lines_inv = results['line_inv']
-    if not data.storage.empty:
-        data.storage_inv = results['storage_inv']
-
-    if 'folder' in kwargs:
-        folder = kwargs['folder']
-        pd.DataFrame(obj, index=[0]).to_csv(folder + '/obj_inv.csv', index=False)
-        logger.info(f"Writing solutions to {folder}")
-        for i, j in results.items():
-            j.to_csv(folder + '/' + i + '.csv', index=False)
-
-    return{'obj': obj, 'storage_inv': results['storage_inv'], 'line_inv': results['line_inv']}
+def store_run(opt, data, obj, res, store, operational=False, case=None):
+    """Add the objective, investments and optionally the operational tables of a
+    solved model to a ResultStore (or SQLite file), returns the id of the run."""
+    own = isinstance(store, str)
+    store = ResultStore(store) if own else store
+    try:
+        run_id = store.add_run(obj, opt.get_solutions(data, INVESTMENT_TABLES), data.parameters,
+                               getattr(data, 'input_hash', None), case, res)
+        if operational:
+            tables = [t for t in SOLUTION_TABLES if t not in INVESTMENT_TABLES]
+            for table, chunk in opt.iter_solutions(data, tables):
+                store.add_table(run_id, table, chunk)
+        logger.info(f"Run {run_id} added to {store.filename}")
+    finally:
+        if own:
+            store.close()
+    return run_id
 
 
 if __name__ == '__main__':
@@ -0,0 +1,180 @@
+"""
+SQLite store of the results of many runs.
+
+Every run adds a row to the runs table (run id, case, hash of the input files,
+solver, status, objective, gap and time), its general parameters to
+parameters, the terms of its objective to objective and its result tables
+(line_inv, storage_inv, state_investment and optionally the operational
+ones) to tables of the same name with a run_id column. The columns used to
+filter runs are indexed, so questions over hundreds of runs are answered
+without reading any CSV:
+
+    store = ResultStore('results.sqlite')
+    store.runs_with_line(57)          # runs where candidate line 57 was built
+    store.objectives(store.runs(input_hash=key).run_id)
+"""
+import json
+import sqlite3
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# result tables added to the store by default
+INVESTMENT_TABLES = ['line_inv', 'storage_inv', 'state_investment']
+
+# indexes of the result tables, besides run_id
+INDEXES = {
+    'line_inv': [('L_c', 'x_fix_l')],
+    'storage_inv': [('H', 'x_sd_var_kw')],
+    'state_investment': [('state', 'rel_inv')],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY, created TEXT, case_name TEXT, input_hash TEXT, solver TEXT,
+    status TEXT, objective REAL, gap REAL, wall_time REAL);
+CREATE INDEX IF NOT EXISTS runs_input_hash ON runs (input_hash);
+CREATE TABLE IF NOT EXISTS parameters (
+    run_id TEXT REFERENCES runs (run_id), name TEXT, value REAL);
+CREATE INDEX IF NOT EXISTS parameters_name_value ON parameters (name, value);
+CREATE INDEX IF NOT EXISTS parameters_run_id ON parameters (run_id);
+CREATE TABLE IF NOT EXISTS objective (
+    run_id TEXT REFERENCES runs (run_id), term TEXT, value REAL);
+CREATE INDEX IF NOT EXISTS objective_run_id ON objective (run_id);
+"""
+
+
+class ResultStore:
+    """Results of runs in an SQLite file.
+
+    Arguments:
+        filename (str): Database file, created if needed (':memory:' for a\
+        temporary store).
+    """
+
+    def __init__(self, filename='results.sqlite'):
+        self.filename = filename
+        self.con = sqlite3.connect(filename)
+        self.con.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.con.close()
+
+    def add_run(self, objective, results, parameters=None, input_hash=None, case=None,
+                solve=None, run_id=None):
+        """Add the results of a run.
+
+        Arguments:
+            objective (dict): Terms of the objective, as given by\
+            get_objective_solution.
+            results (dict): Result tables (e.g. line_inv, storage_inv and\
+            state_investment from get_solutions), more chunks can be added\
+            later with add_table.
+            parameters (dict): General parameters of the run.
+            input_hash (str): Hash of the input files (see Namespace.input_hash).
+            case (str): Name of the case.
+            solve (SolveResult): Outcome of the solve.
+            run_id (str): Id of the run, a new one by default.
+        Returns:
+            run_id (str): Id of the run.
+        """
+        run_id = run_id or uuid.uuid4().hex
+        with self.con:
+            self.con.execute(
+                'INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (run_id, datetime.now().isoformat(timespec='seconds'), case, input_hash,
+                 getattr(solve, 'solver', None), getattr(solve, 'status', None),
+                 getattr(solve, 'objective', None), getattr(solve, 'gap', None),
+                 getattr(solve, 'wall_time', None)))
+            self.con.executemany('INSERT INTO parameters VALUES (?, ?, ?)',
+                                 [(run_id, k, number(v)) for k, v in (parameters or {}).items()])
+            self.con.executemany('INSERT INTO objective VALUES (?, ?, ?)',
+                                 [(run_id, k, number(v)) for k, v in objective.items()])
+        for name, frame in results.items():
+            if frame is not None:
+                self.add_table(run_id, name, frame)
+        return run_id
+
+    def add_table(self, run_id, name, frame):
+        """Append rows of a result table to a run, e.g. the chunks of\
+        CapsuleModel.iter_solutions."""
+        frame = frame.copy(deep=False)
+        for c in frame.columns:
+            if isinstance(frame[c].dtype, pd.CategoricalDtype):
+                frame[c] = frame[c].astype(frame[c].cat.categories.dtype)
+            elif frame[c].dtype == object:
+                # lists (e.g. rel_on) are stored as JSON
+                frame[c] = frame[c].map(lambda x: json.dumps(np.asarray(x).tolist())
+                                        if isinstance(x, (list, tuple, np.ndarray)) else x)
+        frame.insert(0, 'run_id', run_id)
+        with self.con:
+            frame.to_sql(name, self.con, if_exists='append', index=False)
+            self.con.execute(f'CREATE INDEX IF NOT EXISTS "{name}_run_id" ON "{name}" (run_id)')
+            for columns in INDEXES.get(name, []):
+                self.con.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{"_".join(columns)}" '
+                                 f'ON "{name}" ({", ".join(columns)})')
+
+    def query(self, sql, params=()):
+        """Result of an SQL query as a DataFrame."""
+        return pd.read_sql_query(sql, self.con, params=params)
+
+    def runs(self, input_hash=None, case=None, **parameters):
+        """Runs, filtered by input hash, case and values of general parameters\
+        (e.g. runs(alpha_cvar=0.95)), with their parameters as columns."""
+        where, params = [], []
+        if input_hash is not None:
+            where.append('input_hash = ?')
+            params.append(input_hash)
+        if case is not None:
+            where.append('case_name = ?')
+            params.append(case)
+        for name, val in parameters.items():
+            where.append('run_id IN (SELECT run_id FROM parameters WHERE name = ? AND value = ?)')
+            params += [name, number(val)]
+        runs = self.query('SELECT * FROM runs' + (' WHERE ' + ' AND '.join(where) if where else '')
+                          + ' ORDER BY created', params)
+        values = self.query('SELECT * FROM parameters WHERE run_id IN (SELECT run_id FROM runs' +
+                            (' WHERE ' + ' AND '.join(where) if where else '') + ')', params)
+        values = values.pivot_table(index='run_id', columns='name', values='value', aggfunc='first')
+        return runs.merge(values, how='left', left_on='run_id', right_index=True)
+
+    def runs_with_line(self, line, built=True):
+        """Runs where the candidate line L_c (as in line_inv) was built, or not."""
+        return self.query(f'SELECT runs.* FROM runs JOIN line_inv USING (run_id) '
+                          f'WHERE line_inv.L_c = ? AND line_inv.x_fix_l {">" if built else "<="} 0.5 '
+                          f'ORDER BY created', (int(line),))
+
+    def runs_with_storage(self, unit, min_kw=1e-6):
+        """Runs where storage unit H was installed with at least min_kw."""
+        return self.query('SELECT runs.* FROM runs JOIN storage_inv USING (run_id) '
+                          'WHERE storage_inv.H = ? AND storage_inv.x_sd_var_kw >= ? '
+                          'ORDER BY created', (int(unit), float(min_kw)))
+
+    def objectives(self, run_ids=None):
+        """Terms of the objective, one row per run."""
+        terms = self.table('objective', run_ids)
+        return terms.pivot_table(index='run_id', columns='term', values='value', aggfunc='first')
+
+    def table(self, name, run_ids=None):
+        """Rows of a result table, of all runs or of the given ones."""
+        if run_ids is None:
+            return self.query(f'SELECT * FROM "{name}"')
+        run_ids = [run_ids] if isinstance(run_ids, str) else list(run_ids)
+        return self.query(f'SELECT * FROM "{name}" WHERE run_id IN '
+                          f'({", ".join("?" * len(run_ids))})', run_ids)
+
+
+def number(x):
+    """Python float of a numeric value, as text otherwise."""
+    if isinstance(x, (int, float, np.number)) and not isinstance(x, bool):
+        return float(x)
+    return str(x)
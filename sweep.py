@@ -0,0 +1,162 @@
+"""
+Parameter sweeps of the investment model.
+
+The case is preprocessed once, and every point of a grid of general
+parameters (lambda, alpha_cvar, c_imb_usd_kwh, discount_rate, ...) is built,
+solved and summarized on a process pool. Each worker builds its model once
+and only updates the cost and risk parameters for the next points. The
+results are collected in one table indexed by the parameter values. Run from the main folder:
+
+    python sweep.py --lambda 0 0.5 1 --alpha_cvar 0.9 0.95 --workers 4 --threads 1
+"""
+import argparse
+import logging
+import time
+from copy import copy, deepcopy
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import custom_logger
+from cache import DataCache
+from data import read_data_alternative
+from exp_planning import CapsuleModel
+from exp_planning.params import COST_PARAMETERS
+
+logger = logging.getLogger("MAIN")
+
+# general parameters swept from the command line
+SWEEP_PARAMETERS = ['lambda', 'alpha_cvar', 'c_imb_usd_kwh', 'discount_rate']
+
+
+def sweep_grid(values):
+    """Points of the sweep as dictionaries of parameters, for every combination
+    of the given values (e.g. sweep_grid({'lambda': [0, 1], 'alpha_cvar': [0.9, 0.95]}))."""
+    return [dict(zip(values, point)) for point in product(*values.values())]
+
+
+def solve_point(data, point, opt=None, solver=None, matrix=False, options=None):
+    """Build, solve and summarize the model of one point of a sweep.
+
+    Arguments:
+        data (Namespace): Preprocessed case, it is not modified. Its tables\
+        and state_expr are shared read-only by every point, only the general\
+        parameters are copied.
+        point (dict): General parameters that replace those of data.
+        opt (CapsuleModel): Optional model of the same case built for another\
+        point that differs only in COST_PARAMETERS, its parameters are updated\
+        instead of building a new model.
+        solver (str/list): Solver, see CapsuleModel.solve.
+        matrix (bool): True for building the operational constraints in\
+        matrix form.
+        options (dict): Solver options, see CapsuleModel.solve.
+    Returns:
+        row (dict): Solve status and times, objective terms and investments\
+        (x_fix_l of every candidate line, x_sd_var_kw of every storage unit).
+        opt (CapsuleModel): Solved model.
+    """
+    start = time.perf_counter()
+    data = copy(data)
+    data.parameters = {**deepcopy(data.parameters), **point}
+    if opt is None:
+        opt = CapsuleModel()
+        opt.build_model(data, matrix)
+    else:
+        opt.update_parameters(data)
+    res = opt.solve(solver, tee=False, **(options or {}))
+    row = {'status': res.status, 'gap': res.gap, 'solve_time': res.wall_time}
+    if res.objective is not None:
+        row.update(opt.get_objective_solution())
+        results = opt.get_solutions(data)
+        lines = results['line_inv']
+        row.update(zip('x_fix_l_' + lines.L_c.astype(str), lines.x_fix_l.round()))
+        if 'storage_inv' in results:
+            storage = results['storage_inv']
+            row.update(zip('x_sd_var_kw_' + storage.H.astype(str), storage.x_sd_var_kw))
+    row['time'] = time.perf_counter() - start
+    return row, opt
+
+
+_worker = {}
+
+
+def _init_worker(data, kwargs):
+    _worker.update(data=data, kwargs=kwargs, opt=None, built=None)
+
+
+def _solve_worker(point):
+    # the model of the previous point of the worker is reused when only cost
+    # parameters change (bigM is fixed in the matrix constraints)
+    reusable = set(COST_PARAMETERS) - ({'bigM'} if _worker['kwargs'].get('matrix') else set())
+    built = {k: v for k, v in point.items() if k not in reusable}
+    opt = _worker['opt'] if built == _worker['built'] else None
+    try:
+        row, _worker['opt'] = solve_point(_worker['data'], point, opt, **_worker['kwargs'])
+        _worker['built'] = built
+        return row
+    except Exception as e:
+        logger.error(f'Sweep point {point} failed: {e!r}')
+        _worker['opt'] = None
+        return {'status': 'error'}
+
+
+def run_sweep(data, grid, workers=1, folder=None, **kwargs):
+    """Solve the model for every point of a sweep.
+
+    Arguments:
+        data (Namespace): Preprocessed case, from read_data_alternative.
+        grid (list): Points of the sweep, dictionaries of general parameters\
+        (see sweep_grid).
+        workers (int): Number of processes, the data is sent once to each.
+        folder (str): Optional folder to write the table as sweep.csv.
+        kwargs: solver, matrix and options, passed to solve_point.
+    Returns:
+        results (pd.DataFrame): One row per point indexed by its parameters.
+    """
+    logger.info(f'Sweeping {len(grid)} points on {workers} workers')
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(data, kwargs)) as pool:
+            rows = list(pool.map(_solve_worker, grid))
+    else:
+        _init_worker(data, kwargs)
+        rows = [_solve_worker(point) for point in grid]
+
+    results = pd.DataFrame(rows, index=pd.MultiIndex.from_frame(pd.DataFrame(grid)))
+    if folder is not None:
+        results.to_csv(folder + '/sweep.csv')
+        logger.info(f'Sweep results written to {folder}/sweep.csv')
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sweep general parameters of the REPAIR model.")
+    parser.add_argument("--case", default="example_case")
+    for p in SWEEP_PARAMETERS:
+        parser.add_argument(f"--{p}", dest=p, type=float, nargs="+", default=None,
+                            help=f"values of {p}, the value of the case by default")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--matrix", action="store_true",
+                        help="build the operational constraints in matrix form")
+    parser.add_argument("--solver", nargs="+", default=None)
+    parser.add_argument("--threads", type=int, default=None, help="threads of every solve")
+    parser.add_argument("--mip-gap", type=float, default=None)
+    parser.add_argument("--time-limit", type=float, default=None)
+    parser.add_argument("--folder", default="solutions")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    custom_logger.init_logger(filename="run_sweep.log")
+    data = read_data_alternative(args.case, cache=DataCache('.cache'))
+    values = {p: getattr(args, p) or [data.parameters[p]] for p in SWEEP_PARAMETERS}
+    options = {'threads': args.threads, 'mip_gap': args.mip_gap, 'time_limit': args.time_limit}
+    results = run_sweep(data, sweep_grid(values), workers=args.workers, folder=args.folder,
+                        solver=args.solver, matrix=args.matrix, options=options)
+    logger.info('\n' + results.reindex(columns=['status', 'obj', 'gap', 'time']).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+update_objective on a small synthetic feeder: the objective built again after
+replacing one of its terms gives the same solution as a model built with that
+term from the start. Run from the main folder:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+from pyomo.environ import minimize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from data import read_case, build_network, states_evaluation, Namespace, ROUTINE_FAILURES  # noqa: E402
+from exp_planning import CapsuleModel  # noqa: E402
+from exp_planning import objective  # noqa: E402
+from exp_planning.solvers import is_available  # noqa: E402
+from synthetic_case import synthetic_case  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not is_available('appsi_highs'), reason='requires highspy')
+
+
+@pytest.fixture(scope='module')
+def data(tmp_path_factory):
+    folder = str(tmp_path_factory.mktemp('case'))
+    synthetic_case(folder, buses=30, candidates=4, storage=2, days=2, events=8)
+    # the extreme events of data.EXTREME_EVENTS refer to branches of the example case
+    data = Namespace(**build_network(read_case(folder), ROUTINE_FAILURES, []).get_data())
+    data.parameters = pd.read_csv(folder + '/generalParameters.csv').T.to_dict()[0]
+    data.state_expr = states_evaluation(data)
+    return data
+
+
+def model(data):
+    opt = CapsuleModel()
+    opt.model.FIX_V_SLACK = False
+    opt.build_model(data)
+    return opt
+
+
+def line_costs_doubled(m):
+    return 2 * sum(m.c_fix_l[l] * m.x_fix_l[l] for l in m.L_c)
+
+
+@pytest.mark.parametrize('persistent', [False, True])
+def test_update_objective(data, monkeypatch, persistent):
+    opt = model(data)
+    before = opt.solve('appsi_highs', tee=False, persistent=persistent)
+
+    opt.model.line_costs = line_costs_doubled(opt.model)
+    opt.update_objective()
+    after = opt.solve('appsi_highs', tee=False, persistent=persistent)
+
+    monkeypatch.setattr(objective, 'line_costs', line_costs_doubled)
+    fresh = model(data).solve('appsi_highs', tee=False)
+
+    assert opt.model.obj.sense == minimize
+    assert after.optimal and fresh.optimal
+    assert after.objective == pytest.approx(fresh.objective, rel=1e-6)
+    assert after.objective > before.objective
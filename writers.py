@@ -0,0 +1,142 @@
+"""
+Writers of result tables.
+
+A writer keeps one file per table in a folder and is given the tables, or
+their chunks one after the other, as they are read from the model (see
+CapsuleModel.iter_solutions). CSV files are written whole, as before.
+Parquet and Feather files (pyarrow, imported when they are written) are
+written one chunk per row group or record batch, with compression and typed
+columns: strings and categorical index columns are written as dictionaries.
+New formats subclass ResultWriter and are added to WRITERS.
+
+    with result_writer('parquet', 'solutions') as writer:
+        for table, chunk in opt.iter_solutions(data, by_day=writer.chunked):
+            writer.write(table, chunk)
+"""
+import os
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+
+class ResultWriter(ABC):
+    """Base writer, one file per table in a folder. Formats implement write.
+
+    Arguments:
+        folder (str): Output folder, created if needed.
+        compression (str): Compression of the files, see each format.
+    Attributes:
+        chunked (bool): True if the writer takes tables in chunks (e.g. by\
+        day), False for whole tables.
+    """
+    extension = None
+    chunked = True
+
+    def __init__(self, folder, compression=None):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.compression = compression
+        self.files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def path(self, table):
+        return f'{self.folder}/{table}.{self.extension}'
+
+    @abstractmethod
+    def write(self, table, frame):
+        """Write a table, or the next chunk of a table."""
+
+    def close(self):
+        """Finish the files of every table."""
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+class CSVWriter(ResultWriter):
+    """CSV files, chunks are appended to the file of their table."""
+    extension = 'csv'
+    chunked = False
+
+    def write(self, table, frame):
+        first = table not in self.files
+        self.files.setdefault(table, None)
+        frame.to_csv(self.path(table), mode='w' if first else 'a', header=first, index=False,
+                     compression=self.compression)
+
+    def close(self):
+        self.files = {}
+
+
+class ParquetWriter(ResultWriter):
+    """Parquet files with a row group per chunk, zstd compression by default."""
+    extension = 'parquet'
+
+    def __init__(self, folder, compression='zstd'):
+        super().__init__(folder, compression)
+
+    def write(self, table, frame):
+        import pyarrow.parquet as pq
+        arrow = to_arrow(frame, self.files[table].schema if table in self.files else None)
+        if table not in self.files:
+            self.files[table] = pq.ParquetWriter(self.path(table), arrow.schema,
+                                                 compression=self.compression)
+        self.files[table].write_table(arrow)
+
+
+class FeatherWriter(ResultWriter):
+    """Feather (Arrow IPC) files with a record batch per chunk, zstd compression
+    by default (lz4 and zstd are supported)."""
+    extension = 'feather'
+
+    def __init__(self, folder, compression='zstd'):
+        super().__init__(folder, compression)
+        self.schemas = {}
+
+    def write(self, table, frame):
+        import pyarrow as pa
+        arrow = to_arrow(frame, self.schemas.get(table))
+        if table not in self.files:
+            self.schemas[table] = arrow.schema
+            self.files[table] = pa.ipc.new_file(
+                self.path(table), arrow.schema,
+                options=pa.ipc.IpcWriteOptions(compression=self.compression))
+        self.files[table].write_table(arrow)
+
+
+# writers by format
+WRITERS = {'csv': CSVWriter, 'parquet': ParquetWriter, 'feather': FeatherWriter}
+
+
+def result_writer(fmt, folder, **options):
+    """Writer of a format of WRITERS to a folder, options are passed to it."""
+    if fmt not in WRITERS:
+        raise ValueError(f'Unknown result format {fmt}, use one of {", ".join(WRITERS)}')
+    return WRITERS[fmt](folder, **options)
+
+
+def to_arrow(frame, schema=None):
+    """Arrow table of a chunk, with the schema of the previous chunks of its
+    table if given. Columns of strings are written as categorical, those of
+    mixed scalar types as categorical strings."""
+    import pyarrow as pa
+    frame = frame.copy(deep=False)
+    for c in frame.columns:
+        if frame[c].dtype != object:
+            continue
+        kind = pd.api.types.infer_dtype(frame[c], skipna=True)
+        if kind == 'string':
+            frame[c] = frame[c].astype('category')
+        elif kind.startswith('mixed') and not frame[c].map(is_sequence).any():
+            frame[c] = frame[c].astype(str).astype('category')
+    return pa.Table.from_pandas(frame, schema=schema, preserve_index=False)
+
+
+def is_sequence(x):
+    return isinstance(x, (list, tuple, set))